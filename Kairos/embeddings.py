@@ -0,0 +1,365 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy
+
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+from langchain.embeddings.base import Embeddings
+
+
+_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", str(Path.home() / ".kairos" / "embeddings.sqlite")
+)
+
+_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1024**3))
+
+_DEFAULT_MODELS = {
+    "openai": "text-embedding-ada-002",
+    "sentence-transformers": "sentence-transformers/all-MiniLM-L6-v2",
+    "onnx": "sentence-transformers/all-MiniLM-L6-v2",
+}
+
+
+class EmbeddingCache:
+    path: str
+    max_size: int
+    hits: int
+    misses: int
+
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _size: int
+
+    def __init__(self, path: Optional[str] = None, max_size: Optional[int] = None):
+        if path is None:
+            path = _CACHE_PATH
+
+        if max_size is None:
+            max_size = _CACHE_SIZE
+
+        logging.debug(f"Opening embedding cache: {path=}, {max_size=}")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB, size INTEGER, accessed REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        self._connection.commit()
+
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, numpy.ndarray]:
+        found = {}
+
+        with self._lock:
+            # Chunked to stay under SQLite's bound parameter limit.
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                found.update(
+                    (key, numpy.frombuffer(vector, dtype=numpy.float32))
+                    for key, vector in rows
+                )
+
+            now = time.time()
+            self._connection.executemany(
+                "UPDATE embeddings SET accessed = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._connection.commit()
+
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = [
+            (key, numpy.asarray(vector, dtype=numpy.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+
+        with self._lock:
+            for key, vector, accessed in rows:
+                previous = self._connection.execute(
+                    "SELECT size FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if previous is not None:
+                    self._size -= previous[0]
+
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    (key, vector, len(vector), accessed),
+                )
+                self._size += len(vector)
+
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        if self._size <= self.max_size:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM embeddings ORDER BY accessed"
+        ):
+            if self._size <= self.max_size:
+                break
+
+            evicted.append((key,))
+            self._size -= size
+
+        logging.debug(f"Evicting embeddings from cache: {len(evicted)=}")
+
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "size": self._size,
+                "max_size": self.max_size,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    embeddings: Embeddings
+    cache: EmbeddingCache
+    document_model: str
+    query_model: str
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.document_model = getattr(
+            embeddings, "document_model_name", type(embeddings).__name__
+        )
+        self.query_model = getattr(
+            embeddings, "query_model_name", type(embeddings).__name__
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(self.document_model, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+
+        if missing:
+            logging.debug(f"Embedding cache misses: {len(missing)=}")
+
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(
+                (key, numpy.asarray(vector, dtype=numpy.float32))
+                for key, vector in computed.items()
+            )
+
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.key(self.query_model, text)
+        found = self.cache.get_many([key])
+
+        if key in found:
+            return found[key].tolist()
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+
+        return vector
+
+
+class LocalEmbeddings(Embeddings):
+    model: str
+    num_threads: Optional[int]
+    batch_size: int
+
+    _lock: threading.Lock
+
+    def __init__(
+        self, model: str, num_threads: Optional[int] = None, batch_size: int = 64
+    ):
+        self.model = model
+        self.num_threads = num_threads
+        self.batch_size = batch_size
+
+        # Ingestion embeds from several threads; the model already uses all
+        # of its threads, so batches run one at a time.
+        self._lock = threading.Lock()
+
+    @property
+    def document_model_name(self) -> str:
+        return self.model
+
+    @property
+    def query_model_name(self) -> str:
+        return self.model
+
+    def _embed(self, texts: List[str]) -> numpy.ndarray:
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        # Batching texts of similar length keeps padding to a minimum.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+
+        for i in range(0, len(order), self.batch_size):
+            batch = order[i : i + self.batch_size]
+            with self._lock:
+                embedded = self._embed([texts[j] for j in batch])
+            for j, vector in zip(batch, embedded):
+                vectors[j] = vector.tolist()
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class SentenceTransformerEmbeddings(LocalEmbeddings):
+    _model: "sentence_transformers.SentenceTransformer"
+
+    def __init__(
+        self, model: str, num_threads: Optional[int] = None, batch_size: int = 64
+    ):
+        super().__init__(model, num_threads, batch_size)
+
+        try:
+            import torch
+            import sentence_transformers
+        except ImportError:
+            raise ImportError(
+                "The sentence-transformers embeddings backend requires "
+                "sentence-transformers, install it with "
+                "`pip install sentence-transformers`"
+            )
+
+        logging.debug(f"Loading sentence-transformers embeddings: {model=}")
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self._model = sentence_transformers.SentenceTransformer(model, device="cpu")
+
+    def _embed(self, texts: List[str]) -> numpy.ndarray:
+        return self._model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        )
+
+
+class OnnxEmbeddings(LocalEmbeddings):
+    _tokenizer: "transformers.PreTrainedTokenizer"
+    _session: "onnxruntime.InferenceSession"
+    _inputs: List[str]
+
+    def __init__(
+        self, model: str, num_threads: Optional[int] = None, batch_size: int = 64
+    ):
+        super().__init__(model, num_threads, batch_size)
+
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoTokenizer
+
+        logging.debug(f"Loading onnx embeddings: {model=}")
+
+        # Either a local folder or a hub repository, with the exported model
+        # at onnx/model.onnx as sentence-transformers repositories ship it.
+        if os.path.isdir(model):
+            path = os.path.join(model, "onnx", "model.onnx")
+        else:
+            path = hf_hub_download(model, "onnx/model.onnx")
+
+        options = onnxruntime.SessionOptions()
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        self._tokenizer = AutoTokenizer.from_pretrained(model)
+        self._session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self._inputs = [input.name for input in self._session.get_inputs()]
+
+    def _embed(self, texts: List[str]) -> numpy.ndarray:
+        encoded = self._tokenizer(
+            texts, padding=True, truncation=True, return_tensors="np"
+        )
+        hidden = self._session.run(
+            None, {name: encoded[name].astype(numpy.int64) for name in self._inputs}
+        )[0]
+
+        # Mean pooling over the real tokens, then unit length, as
+        # sentence-transformers does.
+        mask = encoded["attention_mask"][..., None].astype(numpy.float32)
+        pooled = (hidden * mask).sum(axis=1) / numpy.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / numpy.linalg.norm(pooled, axis=1, keepdims=True)
+
+
+_BACKENDS: Dict[str, Type[LocalEmbeddings]] = {
+    "sentence-transformers": SentenceTransformerEmbeddings,
+    "onnx": OnnxEmbeddings,
+}
+
+
+def load_embeddings(
+    backend: str = "openai",
+    model: Optional[str] = None,
+    num_threads: Optional[int] = None,
+    batch_size: int = 64,
+) -> Embeddings:
+    if backend not in _DEFAULT_MODELS:
+        raise ValueError(f"Unknown embeddings backend {backend}")
+
+    if model is None:
+        model = _DEFAULT_MODELS[backend]
+
+    if backend == "openai":
+        from langchain.embeddings.openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(document_model_name=model, query_model_name=model)
+
+    return _BACKENDS[backend](model, num_threads=num_threads, batch_size=batch_size)
@@ -0,0 +1,112 @@
+import math
+import logging
+import faiss
+import numpy
+
+
+_hnsw_m = 32
+
+# More training points per list than this buy little.
+_train_points_per_list = 64
+
+# An IVF index is rebuilt once it holds this many times the rows its lists
+# were sized for.
+_rebuild_growth = 4
+
+
+def _nlist(rows: int) -> int:
+    # ~4 sqrt(n) lists, but never fewer than 39 training points per list.
+    return max(1, min(int(4 * math.sqrt(rows)), rows // 39))
+
+
+def _sized_rows(nlist: int) -> int:
+    # Inverse of _nlist: the row count an IVF index with nlist lists suits.
+    return max(int((nlist / 4) ** 2), 39 * nlist)
+
+
+def _pq_m(dim: int) -> int:
+    return next(m for m in (64, 48, 32, 16, 8, 4, 2, 1) if dim % m == 0)
+
+
+def factory_string(type: str, rows: int, dim: int) -> str:
+    if type == "flat":
+        return "Flat"
+    if type == "ivf-flat":
+        return f"IVF{_nlist(rows)},Flat"
+    if type == "ivf-pq":
+        return f"IVF{_nlist(rows)},PQ{_pq_m(dim)}"
+    if type == "hnsw":
+        return f"HNSW{_hnsw_m},Flat"
+
+    raise ValueError(f"Unknown index type {type}")
+
+
+def tune(index: faiss.Index, nprobe: int, ef_search: int):
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+        return
+
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        # Not an IVF index: nothing to tune.
+        pass
+
+
+def build_index(
+    type: str, vectors: numpy.ndarray, nprobe: int, ef_search: int
+) -> faiss.Index:
+    rows, dim = vectors.shape
+    factory = factory_string(type, rows, dim)
+
+    logging.debug(f"Building index: {factory=}, {rows=}")
+
+    index = faiss.index_factory(dim, factory)
+
+    if not index.is_trained:
+        ivf = faiss.extract_index_ivf(index)
+        sample = min(rows, ivf.nlist * _train_points_per_list)
+        rng = numpy.random.default_rng(0)
+        index.train(vectors[rng.choice(rows, sample, replace=False)])
+
+    try:
+        # Lets the store reconstruct rows it hasn't saved yet.
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+
+    index.add(vectors)
+    tune(index, nprobe, ef_search)
+
+    return index
+
+
+def needs_rebuild(index: faiss.Index, type: str, promote_rows: int) -> bool:
+    if type == "flat":
+        return False
+
+    if isinstance(index, faiss.IndexFlat):
+        return index.ntotal >= promote_rows
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+
+    return index.ntotal > _rebuild_growth * _sized_rows(ivf.nlist)
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    # With IO_FLAG_MMAP faiss maps IVF inverted lists read-only instead of
+    # reading them; other index types are read as usual.
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP if mmap else 0)
+
+
+def is_read_only(index: faiss.Index) -> bool:
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return False
+
+    invlists = faiss.downcast_InvertedLists(ivf.invlists)
+    return isinstance(invlists, faiss.OnDiskInvertedLists) and invlists.read_only
@@ -0,0 +1,432 @@
+import time
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+from Kairos.utils import uuid
+
+
+# Lower runs first: interactive requests go ahead of bulk work.
+_PRIORITIES = {
+    "chat": 0,
+    "run": 1,
+    "generate": 1,
+    "edit": 1,
+    "dialog": 1,
+    "save": 2,
+    "load": 2,
+    "summary": 2,
+    "ideas": 3,
+    "ingest": 4,
+    "bulk": 5,
+}
+
+_DEFAULT_PRIORITY = 3
+
+_TYPE_LIMITS = {
+    "ingest": 2,
+    "bulk": 1,
+}
+
+_TIMEOUTS = {
+    "chat": 300,
+    "run": 600,
+    "generate": 600,
+    "edit": 600,
+    "summary": 600,
+    "ideas": 900,
+}
+
+
+class Job(BaseModel):
+    id: str
+    status: str
+    error: bool
+    output: Optional[Any]
+
+
+class _Entry:
+    job: Job
+    notebook_id: str
+    type: str
+    priority: int
+    func: Callable[[], Any]
+    queued_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    timeout: Optional[float]
+    is_async: bool
+    future: Optional[Future]
+    waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]
+
+    def __init__(
+        self,
+        job: Job,
+        notebook_id: str,
+        type: str,
+        priority: int,
+        func: Callable[[], Any],
+        timeout: Optional[float],
+    ):
+        self.job = job
+        self.notebook_id = notebook_id
+        self.type = type
+        self.priority = priority
+        self.func = func
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.timeout = timeout
+        self.is_async = asyncio.iscoroutinefunction(func)
+        self.future = None
+        self.waiters = []
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class JobScheduler:
+    max_workers: int
+    max_per_notebook: int
+    retention: float
+    max_finished: int
+    max_async_jobs: int
+    on_event: Optional[Callable[[str, str, Job], None]]
+    loop: Optional[asyncio.AbstractEventLoop]
+
+    _entries: Dict[str, OrderedDict]
+    _queue: List[_Entry]
+    _running: List[_Entry]
+    _cond: threading.Condition
+    _workers: List[threading.Thread]
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_per_notebook: int = 4,
+        retention: float = 3600,
+        max_finished: int = 100,
+        max_async_jobs: int = 64,
+        on_event: Optional[Callable[[str, str, Job], None]] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_per_notebook = max_per_notebook
+        self.retention = retention
+        self.max_finished = max_finished
+        self.max_async_jobs = max_async_jobs
+        self.on_event = on_event
+        self.loop = loop
+
+        self._entries = {}
+        self._queue = []
+        self._running = []
+        self._cond = threading.Condition()
+
+        self._workers = [
+            threading.Thread(target=self._work, daemon=True) for _ in range(max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def submit(
+        self,
+        notebook_id: str,
+        type: str,
+        func: Callable[[], Any],
+        job_id: Optional[str] = None,
+        priority: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        if job_id is None:
+            job_id = uuid()
+
+        if priority is None:
+            priority = _PRIORITIES.get(type, _DEFAULT_PRIORITY)
+
+        if timeout is None:
+            timeout = _TIMEOUTS.get(type)
+
+        logging.debug(f"Submitting job: {notebook_id=}, {job_id=}, {type=}")
+
+        entry = _Entry(
+            Job(id=job_id, status="queued", error=False, output=None),
+            notebook_id,
+            type,
+            priority,
+            func,
+            timeout,
+        )
+
+        with self._cond:
+            self._entries.setdefault(notebook_id, OrderedDict())[job_id] = entry
+            self._queue.append(entry)
+            self._evict()
+            self._cond.notify_all()
+
+        self._notify(entry, "queued")
+
+        return job_id
+
+    def get(self, notebook_id: str, job_id: str) -> Optional[Job]:
+        with self._cond:
+            entry = self._entries.get(notebook_id, {}).get(job_id)
+            return entry.job.copy() if entry is not None else None
+
+    def wait(
+        self, notebook_id: str, job_id: str, timeout: Optional[float] = None
+    ) -> Optional[Job]:
+        with self._cond:
+            entry = self._entries.get(notebook_id, {}).get(job_id)
+            if entry is None:
+                return None
+
+            self._cond.wait_for(
+                lambda: entry.job.status not in ("queued", "running"), timeout
+            )
+
+            return entry.job.copy()
+
+    async def wait_async(
+        self, notebook_id: str, job_id: str, timeout: Optional[float] = None
+    ) -> Optional[Job]:
+        # Same as wait, but parks a future on the caller's loop instead of a
+        # thread, so long polls are cheap.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        with self._cond:
+            entry = self._entries.get(notebook_id, {}).get(job_id)
+            if entry is None:
+                return None
+
+            if entry.job.status not in ("queued", "running"):
+                return entry.job.copy()
+
+            entry.waiters.append((loop, future))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if (loop, future) in entry.waiters:
+                    entry.waiters.remove((loop, future))
+
+        with self._cond:
+            return entry.job.copy()
+
+    def progress(self, notebook_id: str, job_id: str, output: Any):
+        with self._cond:
+            entry = self._entries.get(notebook_id, {}).get(job_id)
+            if entry is None or entry.job.status != "running":
+                return
+
+            entry.job.output = output
+
+        self._notify(entry, "progress")
+
+    def jobs(self, notebook_id: str) -> List[Job]:
+        with self._cond:
+            return [
+                entry.job.copy()
+                for entry in self._entries.get(notebook_id, {}).values()
+            ]
+
+    def cancel(self, notebook_id: str, job_id: str) -> bool:
+        # Queued jobs never start. Running async jobs are cancelled on their
+        # loop; running sync jobs can't be interrupted, so they are marked
+        # cancelled and their output is discarded when they return.
+        with self._cond:
+            entry = self._entries.get(notebook_id, {}).get(job_id)
+            if entry is None or entry.job.status not in ("queued", "running"):
+                return False
+
+            if entry in self._queue:
+                self._queue.remove(entry)
+
+            self._finish(entry, "cancelled", True, "Job cancelled")
+            self._cond.notify_all()
+
+        if entry.future is not None:
+            entry.future.cancel()
+
+        self._notify(entry, "cancelled")
+
+        return True
+
+    def _notify(self, entry: _Entry, event: str):
+        if self.on_event is None:
+            return
+
+        with self._cond:
+            job = entry.job.copy()
+
+        try:
+            self.on_event(entry.notebook_id, event, job)
+        except Exception:
+            logging.exception(f"Failed to notify job event {event}")
+
+    def _finish(self, entry: _Entry, status: str, error: bool, output: Any):
+        entry.job.status = status
+        entry.job.error = error
+        entry.job.output = output
+        entry.finished_at = time.monotonic()
+
+        for loop, future in entry.waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                # The waiter's loop has been closed.
+                pass
+        entry.waiters = []
+
+    def _next(self) -> Optional[_Entry]:
+        running_per_notebook = {}
+        running_per_type = {}
+        running_async = 0
+        for entry in self._running:
+            running_async += entry.is_async
+            running_per_notebook[entry.notebook_id] = (
+                running_per_notebook.get(entry.notebook_id, 0) + 1
+            )
+            running_per_type[entry.type] = running_per_type.get(entry.type, 0) + 1
+
+        for entry in sorted(self._queue, key=lambda entry: entry.priority):
+            if running_per_notebook.get(entry.notebook_id, 0) >= self.max_per_notebook:
+                continue
+
+            limit = _TYPE_LIMITS.get(entry.type)
+            if limit is not None and running_per_type.get(entry.type, 0) >= limit:
+                continue
+
+            if entry.is_async and running_async >= self.max_async_jobs:
+                continue
+
+            return entry
+
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                entry = self._next()
+                while entry is None:
+                    self._cond.wait()
+                    entry = self._next()
+
+                self._queue.remove(entry)
+                self._running.append(entry)
+                entry.job.status = "running"
+                entry.started_at = time.monotonic()
+
+            self._notify(entry, "started")
+
+            logging.debug(f"Running job: {entry.job.id=}, {entry.type=}")
+
+            if entry.is_async and self.loop is not None:
+                # Coroutines run on the server's loop and don't hold a worker
+                # while they wait on the network.
+                with self._cond:
+                    entry.future = asyncio.run_coroutine_threadsafe(
+                        entry.func(), self.loop
+                    )
+                entry.future.add_done_callback(
+                    lambda future, entry=entry: self._done(entry, future)
+                )
+                continue
+
+            try:
+                if entry.is_async:
+                    output = asyncio.run(entry.func())
+                else:
+                    output = entry.func()
+                error = False
+            except Exception as e:
+                logging.exception(f"Job {entry.job.id} failed")
+                output = str(e)
+                error = True
+
+            self._complete(entry, output, error)
+
+    def _done(self, entry: _Entry, future: Future):
+        if future.cancelled():
+            self._complete(entry, "Job cancelled", True)
+            return
+
+        try:
+            output = future.result()
+            error = False
+        except Exception as e:
+            logging.exception(f"Job {entry.job.id} failed")
+            output = str(e)
+            error = True
+
+        self._complete(entry, output, error)
+
+    def _complete(self, entry: _Entry, output: Any, error: bool):
+        with self._cond:
+            self._running.remove(entry)
+            finished = entry.job.status == "running"
+            if finished:
+                self._finish(entry, "finished", error, output)
+            self._cond.notify_all()
+
+        if finished:
+            self._notify(entry, "failed" if error else "finished")
+
+    def _watch(self):
+        while True:
+            time.sleep(1)
+
+            timed_out = []
+            with self._cond:
+                now = time.monotonic()
+                for entry in self._running:
+                    if (
+                        entry.job.status == "running"
+                        and entry.timeout is not None
+                        and now - entry.started_at > entry.timeout
+                    ):
+                        logging.debug(f"Job timed out: {entry.job.id=}")
+                        self._finish(entry, "finished", True, "Job timed out")
+                        timed_out.append(entry)
+
+                self._evict()
+                self._cond.notify_all()
+
+            for entry in timed_out:
+                if entry.future is not None:
+                    entry.future.cancel()
+                self._notify(entry, "failed")
+
+    def _evict(self):
+        now = time.monotonic()
+        for notebook_id, entries in list(self._entries.items()):
+            # Cancelled or timed out jobs are kept until their thread returns.
+            finished = [
+                entry
+                for entry in entries.values()
+                if entry.finished_at is not None and entry not in self._running
+            ]
+            expired = [
+                entry for entry in finished if now - entry.finished_at > self.retention
+            ]
+            remaining = [entry for entry in finished if entry not in expired]
+            overflow = remaining[: max(0, len(remaining) - self.max_finished)]
+
+            for entry in expired + overflow:
+                del entries[entry.job.id]
+
+            if not entries:
+                del self._entries[notebook_id]
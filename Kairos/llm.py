@@ -0,0 +1,636 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+import contextlib
+import contextvars
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from langchain.llms import OpenAI
+from langchain.schema import Generation, LLMResult
+
+from Kairos.utils import Lazy
+
+
+_LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# Prompts per completion request when they don't stream.
+_LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", 20))
+
+_LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", str(Path.home() / ".kairos" / "completions.sqlite")
+)
+
+_LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 256 * 1024**2))
+
+_LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 30 * 24 * 3600))
+
+# Call types whose completions are cached, and those cached even when sampled
+# at a temperature above 0, where a new request could answer differently.
+_LLM_CACHE = set(
+    filter(None, os.getenv("LLM_CACHE", "summary,calculator,ideas").split(","))
+)
+
+# Summaries and calculator answers are only sampled for wording; ideas are
+# meant to differ between runs.
+_LLM_CACHE_FORCE = set(
+    filter(None, os.getenv("LLM_CACHE_FORCE", "summary,calculator").split(","))
+)
+
+_max_attempts = 6
+
+_min_backoff = 1.0
+
+_max_backoff = 60.0
+
+
+class AdaptiveLimiter:
+    # Caps concurrent requests across threads and event loops. The limit is
+    # halved when the API pushes back and grows by one request per window of
+    # successes (AIMD), so it settles just under the account's rate limit.
+    max_concurrency: int
+    limit: float
+    throttled: int
+
+    _active: int
+    _failures: int
+    _resume_at: float
+    _waiters: Deque[Callable[[], None]]
+    _lock: threading.Lock
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.throttled = 0
+
+        self._active = 0
+        self._failures = 0
+        self._resume_at = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _has_slot(self) -> bool:
+        return self._active < max(1, int(self.limit))
+
+    def _wake(self):
+        # Caller holds the lock. Slots are handed over in arrival order.
+        while self._waiters and self._has_slot():
+            self._active += 1
+            self._waiters.popleft()()
+
+    def acquire(self):
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                self._active += 1
+                return
+
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+
+        granted.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def _grant():
+            if future.cancelled():
+                self.release()
+            else:
+                future.set_result(None)
+
+        def _waiter():
+            loop.call_soon_threadsafe(_grant)
+
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                self._active += 1
+                return
+
+            self._waiters.append(_waiter)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(_waiter)
+                except ValueError:
+                    # Already granted: _grant gives the slot back.
+                    pass
+            raise
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+            self._wake()
+
+    def delay(self) -> float:
+        return max(0.0, self._resume_at - time.monotonic())
+
+    def succeeded(self):
+        with self._lock:
+            self._failures = 0
+            if self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self._wake()
+
+    def throttle(self) -> float:
+        with self._lock:
+            self.throttled += 1
+            self._failures += 1
+            self.limit = max(1.0, self.limit / 2)
+
+            backoff = min(_max_backoff, _min_backoff * 2 ** (self._failures - 1))
+            backoff *= random.uniform(0.5, 1.0)
+            self._resume_at = max(self._resume_at, time.monotonic() + backoff)
+
+            logging.debug(f"LLM requests throttled: {self.limit=}, {backoff=}")
+
+            return backoff
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "throttled": self.throttled,
+            }
+
+
+_limiter = AdaptiveLimiter(_LLM_MAX_CONCURRENCY)
+
+
+class CompletionCache:
+    path: str
+    max_size: int
+    ttl: float
+    hits: Dict[str, int]
+    misses: Dict[str, int]
+
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _size: int
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_size: Optional[int] = None,
+        ttl: Optional[float] = None,
+    ):
+        if path is None:
+            path = _LLM_CACHE_PATH
+
+        if max_size is None:
+            max_size = _LLM_CACHE_SIZE
+
+        if ttl is None:
+            ttl = _LLM_CACHE_TTL
+
+        logging.debug(f"Opening completion cache: {path=}, {max_size=}, {ttl=}")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, generation TEXT, size INTEGER, "
+            "created REAL, accessed REAL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed "
+            "ON completions (accessed)"
+        )
+        self._connection.commit()
+
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions"
+        ).fetchone()[0]
+
+    @staticmethod
+    def key(params: Dict[str, Any], prompt: str) -> str:
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{params}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get_many(self, type: str, keys: List[str]) -> Dict[str, Generation]:
+        found = {}
+
+        with self._lock:
+            now = time.time()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._connection.execute(
+                    "SELECT key, generation FROM completions "
+                    f"WHERE key IN ({','.join('?' * len(chunk))}) AND created > ?",
+                    [*chunk, now - self.ttl],
+                ).fetchall()
+                found.update(
+                    (key, Generation(**json.loads(generation)))
+                    for key, generation in rows
+                )
+
+            self._connection.executemany(
+                "UPDATE completions SET accessed = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+            self._connection.commit()
+
+            self.hits[type] = self.hits.get(type, 0) + len(found)
+            self.misses[type] = self.misses.get(type, 0) + len(keys) - len(found)
+
+        return found
+
+    def put_many(self, items: Dict[str, Generation]):
+        now = time.time()
+        rows = [
+            (
+                key,
+                json.dumps(
+                    {
+                        "text": generation.text,
+                        "generation_info": generation.generation_info,
+                    }
+                ),
+            )
+            for key, generation in items.items()
+        ]
+
+        with self._lock:
+            for key, generation in rows:
+                previous = self._connection.execute(
+                    "SELECT size FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if previous is not None:
+                    self._size -= previous[0]
+
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                    (key, generation, len(generation), now, now),
+                )
+                self._size += len(generation)
+
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        expired = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM completions WHERE created <= ?",
+            (time.time() - self.ttl,),
+        ).fetchone()[0]
+        if expired:
+            self._connection.execute(
+                "DELETE FROM completions WHERE created <= ?",
+                (time.time() - self.ttl,),
+            )
+            self._size -= expired
+
+        if self._size <= self.max_size:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM completions ORDER BY accessed"
+        ):
+            if self._size <= self.max_size:
+                break
+
+            evicted.append((key,))
+            self._size -= size
+
+        logging.debug(f"Evicting completions from cache: {len(evicted)=}")
+
+        self._connection.executemany("DELETE FROM completions WHERE key = ?", evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM completions"
+            ).fetchone()[0]
+
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+
+            return {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+                "types": {
+                    type: {
+                        "hits": self.hits.get(type, 0),
+                        "misses": self.misses.get(type, 0),
+                    }
+                    for type in sorted(self.hits.keys() | self.misses.keys())
+                },
+                "entries": entries,
+                "size": self._size,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+            }
+
+
+_cache = Lazy("completion cache", CompletionCache)
+
+_call_type: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "call_type", default=None
+)
+
+
+@contextlib.contextmanager
+def call_type(type: str):
+    # Tags the completions made in this thread or task, agents' and chains'
+    # included, for the completion cache.
+    token = _call_type.set(type)
+    try:
+        yield
+    finally:
+        _call_type.reset(token)
+
+
+def _errors():
+    import openai
+
+    # Push-back shrinks the limit; transient errors are only retried.
+    throttle = (openai.error.RateLimitError, openai.error.ServiceUnavailableError)
+    retry = (
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.APIError,
+    )
+    return throttle, retry
+
+
+class PooledOpenAI(OpenAI):
+    # Every completion request, the agents' included, goes through the shared
+    # limiter, which also takes over retries from langchain's fixed backoff.
+    def with_params(self, **params) -> "PooledOpenAI":
+        # A shallow copy with other generation parameters: the client and
+        # callbacks are shared, nothing shared is mutated.
+        return self.copy(update=params)
+
+    def _cache_params(self, stop: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        type = _call_type.get()
+        if type not in _LLM_CACHE:
+            return None
+        if self.temperature > 0 and type not in _LLM_CACHE_FORCE:
+            return None
+
+        params = {**self._invocation_params, "stop": stop}
+        params.pop("request_timeout", None)
+        return params
+
+    def _cached(
+        self, prompts: List[str], stop: Optional[List[str]]
+    ) -> Tuple[List[str], Dict[str, Generation], List[str]]:
+        params = self._cache_params(stop)
+        if params is None:
+            return [], {}, prompts
+
+        keys = [CompletionCache.key(params, prompt) for prompt in prompts]
+        found = _cache.get().get_many(_call_type.get(), keys)
+        missing = [prompt for key, prompt in zip(keys, prompts) if key not in found]
+
+        return keys, found, missing
+
+    def _merge(
+        self,
+        prompts: List[str],
+        keys: List[str],
+        found: Dict[str, Generation],
+        result: Optional[LLMResult],
+    ) -> LLMResult:
+        if result is not None:
+            missing = [key for key in keys if key not in found]
+            computed = {
+                key: generations[0]
+                for key, generations in zip(missing, result.generations)
+            }
+            _cache.get().put_many(computed)
+            found = {**found, **computed}
+
+        return LLMResult(
+            generations=[[found[key]] for key in keys],
+            llm_output=result.llm_output if result is not None else None,
+        )
+
+    def _generate(
+        self, prompts: List[str], stop: Optional[List[str]] = None
+    ) -> LLMResult:
+        keys, found, missing = self._cached(prompts, stop)
+        if not found:
+            result = super()._generate(prompts, stop)
+            return self._merge(prompts, keys, found, result) if keys else result
+
+        logging.debug(f"Completion cache hits: {len(found)=}, {len(missing)=}")
+
+        # A streamed hit still reaches the listeners, in a single token.
+        if self.streaming:
+            for key in keys:
+                if key in found:
+                    self.callback_manager.on_llm_new_token(
+                        found[key].text, verbose=self.verbose
+                    )
+
+        result = super()._generate(missing, stop) if missing else None
+        return self._merge(prompts, keys, found, result)
+
+    async def _agenerate(
+        self, prompts: List[str], stop: Optional[List[str]] = None
+    ) -> LLMResult:
+        keys, found, missing = await asyncio.to_thread(self._cached, prompts, stop)
+        if not found:
+            result = await super()._agenerate(prompts, stop)
+            if not keys:
+                return result
+            return await asyncio.to_thread(self._merge, prompts, keys, found, result)
+
+        logging.debug(f"Completion cache hits: {len(found)=}, {len(missing)=}")
+
+        if self.streaming:
+            for key in keys:
+                if key not in found:
+                    continue
+                if self.callback_manager.is_async:
+                    await self.callback_manager.on_llm_new_token(
+                        found[key].text, verbose=self.verbose
+                    )
+                else:
+                    self.callback_manager.on_llm_new_token(
+                        found[key].text, verbose=self.verbose
+                    )
+
+        result = await super()._agenerate(missing, stop) if missing else None
+        return await asyncio.to_thread(self._merge, prompts, keys, found, result)
+
+    def _attempt(self, create: Callable[[], Any]) -> Any:
+        throttle, retry = _errors()
+
+        for attempt in range(_max_attempts):
+            time.sleep(_limiter.delay())
+            try:
+                response = create()
+            except throttle:
+                if attempt == _max_attempts - 1:
+                    raise
+                _limiter.throttle()
+                continue
+            except retry:
+                if attempt == _max_attempts - 1:
+                    raise
+                time.sleep(min(_max_backoff, _min_backoff * 2**attempt))
+                continue
+
+            _limiter.succeeded()
+            return response
+
+    async def _aattempt(self, create: Callable[[], Any]) -> Any:
+        throttle, retry = _errors()
+
+        for attempt in range(_max_attempts):
+            await asyncio.sleep(_limiter.delay())
+            try:
+                response = await create()
+            except throttle:
+                if attempt == _max_attempts - 1:
+                    raise
+                _limiter.throttle()
+                continue
+            except retry:
+                if attempt == _max_attempts - 1:
+                    raise
+                await asyncio.sleep(min(_max_backoff, _min_backoff * 2**attempt))
+                continue
+
+            _limiter.succeeded()
+            return response
+
+    def _stream(self, kwargs: Dict) -> Iterator[Dict]:
+        # The slot is held until the stream ends, not only while it opens.
+        _limiter.acquire()
+        try:
+            yield from self._attempt(lambda: self.client.create(**kwargs))
+        finally:
+            _limiter.release()
+
+    async def _astream(self, kwargs: Dict) -> AsyncIterator[Dict]:
+        await _limiter.aacquire()
+        try:
+            async for response in await self._aattempt(
+                lambda: self.client.acreate(**kwargs)
+            ):
+                yield response
+        finally:
+            _limiter.release()
+
+    def completion_with_retry(self, **kwargs: Any) -> Any:
+        if kwargs.get("stream"):
+            return self._stream(kwargs)
+
+        _limiter.acquire()
+        try:
+            return self._attempt(lambda: self.client.create(**kwargs))
+        finally:
+            _limiter.release()
+
+    async def acompletion_with_retry(self, **kwargs: Any) -> Any:
+        if kwargs.get("stream"):
+            return self._astream(kwargs)
+
+        await _limiter.aacquire()
+        try:
+            return await self._aattempt(lambda: self.client.acreate(**kwargs))
+        finally:
+            _limiter.release()
+
+    def complete(self, prompts: List[str], stream: bool = False, **params) -> List[str]:
+        # Streamed prompts go one per request, in order, so their tokens don't
+        # interleave. The rest are batched and the batches sent concurrently.
+        if stream:
+            llm = self.with_params(streaming=True, **params)
+            return [llm.generate([prompt]).generations[0][0].text for prompt in prompts]
+
+        llm = self.with_params(streaming=False, **params)
+        batches = [
+            prompts[i : i + _LLM_BATCH_SIZE]
+            for i in range(0, len(prompts), _LLM_BATCH_SIZE)
+        ]
+        if len(batches) <= 1:
+            results = [llm.generate(batch) for batch in batches]
+        else:
+            # Each batch runs in a copy of this context, so it keeps its
+            # call type.
+            contexts = [contextvars.copy_context() for _ in batches]
+            with ThreadPoolExecutor(len(batches)) as executor:
+                results = list(
+                    executor.map(
+                        lambda context, batch: context.run(llm.generate, batch),
+                        contexts,
+                        batches,
+                    )
+                )
+
+        return [
+            generations[0].text
+            for result in results
+            for generations in result.generations
+        ]
+
+    async def acomplete(
+        self, prompts: List[str], stream: bool = False, **params
+    ) -> List[str]:
+        if stream:
+            llm = self.with_params(streaming=True, **params)
+            texts = []
+            for prompt in prompts:
+                result = await llm.agenerate([prompt])
+                texts.append(result.generations[0][0].text)
+            return texts
+
+        llm = self.with_params(streaming=False, **params)
+        results = await asyncio.gather(
+            *(
+                llm.agenerate(prompts[i : i + _LLM_BATCH_SIZE])
+                for i in range(0, len(prompts), _LLM_BATCH_SIZE)
+            )
+        )
+
+        return [
+            generations[0].text
+            for result in results
+            for generations in result.generations
+        ]
+
+
+def llm_stats() -> Dict[str, Any]:
+    return _limiter.stats()
+
+
+def completion_cache_stats() -> Dict[str, Any]:
+    return _cache.get().stats()
@@ -1,16 +1,22 @@
 import os
 import re
 import json
+import hashlib
+import asyncio
 import threading
 import queue
+import time
 import soundcard
 import logging
 import itertools
+import bisect
+import contextlib
 import numpy
+import faiss
 
-from sklearn.manifold import TSNE
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, List, Optional, Dict, Any
+from typing import Any, Callable, Iterator, List, Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 from names_generator import generate_name
 from tkinter import filedialog
@@ -18,17 +24,22 @@ from pydantic import BaseModel
 from langchain import LLMMathChain
 from langchain.document_loaders import PagedPDFSplitter, WebBaseLoader, YoutubeLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.vectorstores import FAISS
-from langchain.llms import OpenAI
 from langchain.agents import initialize_agent, Tool, ZeroShotAgent, ConversationalAgent
 from langchain.docstore.document import Document
+from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.serpapi import SerpAPIWrapper
 from langchain.utilities.wolfram_alpha import WolframAlphaAPIWrapper
 from langchain.chains.conversation.memory import ConversationBufferMemory
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
+from langchain.callbacks.base import CallbackManager
 
-from Kairos.utils import uuid, EventEmitter
+from Kairos.utils import uuid, EventEmitter, Lazy, RWLock
+from Kairos.embeddings import EmbeddingCache, CachedEmbeddings, load_embeddings
+from Kairos.storage import NotebookStore
+from Kairos.search_cache import SearchCache
+from Kairos.llm import PooledOpenAI, call_type
+from Kairos.indexes import build_index, needs_rebuild, tune, is_read_only
+from Kairos.streaming import StreamingHandler, stream_to, emit
 
 load_dotenv()
 
@@ -40,7 +51,45 @@ load_dotenv()
 _AGENT = "zero-shot-react-description"
 _CONVERSATIONAL_AGENT = "conversational-react-description"
 
-_TRANSCRIBER_MODEL = "openai/whisper-medium"
+_TRANSCRIBER_BACKEND = os.getenv("TRANSCRIBER_BACKEND", "transformers")
+
+_TRANSCRIBER_SIZE = os.getenv("TRANSCRIBER_SIZE", "medium")
+
+_TRANSCRIBER_QUANTIZE = os.getenv("TRANSCRIBER_QUANTIZE")
+
+_TRANSCRIBER_THREADS = os.getenv("TRANSCRIBER_THREADS")
+
+_TRANSCRIBER_WARM_UP = os.getenv("TRANSCRIBER_WARM_UP", "false") == "true"
+
+_EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")
+
+_EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL")
+
+_EMBEDDINGS_THREADS = os.getenv("EMBEDDINGS_THREADS")
+
+_EMBEDDINGS_BATCH_SIZE = int(os.getenv("EMBEDDINGS_BATCH_SIZE", 64))
+
+# Notebooks saved before the embeddings model was recorded were all indexed
+# with it.
+_LEGACY_EMBEDDINGS_MODEL = "text-embedding-ada-002"
+
+_INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+
+_INDEX_PROMOTE_ROWS = int(os.getenv("INDEX_PROMOTE_ROWS", 50000))
+
+_INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", 16))
+
+_INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", 64))
+
+_SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 256))
+
+# Cosine similarity above which a new query reuses a cached query's results.
+# Unset, only identical queries hit.
+_SEARCH_CACHE_THRESHOLD = (
+    float(os.getenv("SEARCH_CACHE_THRESHOLD"))
+    if os.getenv("SEARCH_CACHE_THRESHOLD")
+    else None
+)
 
 _SOURCE_TYPE_TO_LOADER = {
     "pdf": PagedPDFSplitter,
@@ -48,34 +97,98 @@ _SOURCE_TYPE_TO_LOADER = {
     "youtube": YoutubeLoader.from_youtube_url,
 }
 
-_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    chunk_size=256,
-    chunk_overlap=0,
+_ingest_batch_size = 64
+
+_ingest_workers = 4
+
+_bulk_workers = 8
+
+_ideas_workers = 4
+
+# Longer documents have this many groups sampled evenly across them.
+_ideas_max_groups = 16
+
+_splitter = Lazy(
+    "splitter",
+    lambda: RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        chunk_size=256,
+        chunk_overlap=0,
+    ),
 )
 
-_embeddings = OpenAIEmbeddings()
 
-_llm = OpenAI(temperature=0.3, max_tokens=-1)
+def _load_embeddings():
+    logging.debug(
+        f"Loading embeddings: {_EMBEDDINGS_BACKEND=} {_EMBEDDINGS_MODEL=} {_EMBEDDINGS_THREADS=}"
+    )
+
+    embeddings = load_embeddings(
+        backend=_EMBEDDINGS_BACKEND,
+        model=_EMBEDDINGS_MODEL,
+        num_threads=int(_EMBEDDINGS_THREADS) if _EMBEDDINGS_THREADS else None,
+        batch_size=_EMBEDDINGS_BATCH_SIZE,
+    )
+
+    return CachedEmbeddings(embeddings, EmbeddingCache())
+
+
+_embeddings = Lazy("embeddings", _load_embeddings)
+
+_serpapi = Lazy("serpapi", SerpAPIWrapper)
+
+_wolfram = Lazy("wolfram", WolframAlphaAPIWrapper)
+
+_callback_manager = CallbackManager([StreamingHandler()])
+
+_llm = PooledOpenAI(
+    temperature=0.3,
+    max_tokens=-1,
+    streaming=True,
+    callback_manager=_callback_manager,
+)
+
+# Not streamed: calculator completions are tool internals, not agent output.
+_llm_math = LLMMathChain(llm=PooledOpenAI(temperature=0.3, max_tokens=-1))
+
+
+def _calculate(query: str) -> str:
+    with call_type("calculator"):
+        return _llm_math.run(query)
+
+
+# Agents only await tool coroutines that pass asyncio.iscoroutinefunction, so
+# these can't be lambdas returning awaitables.
+async def _acalculate(query: str) -> str:
+    return await asyncio.to_thread(_calculate, query)
+
+
+async def _agoogle(query: str) -> str:
+    return await _serpapi.get().arun(query)
+
+
+async def _awolfram(query: str) -> str:
+    return await asyncio.to_thread(_wolfram.get().run, query)
 
-_llm_math = LLMMathChain(llm=_llm)
 
 _calculator_tool = Tool(
     name="Calculator",
     description="useful for when you need to answer questions about math",
-    func=_llm_math.run,
+    func=_calculate,
+    coroutine=_acalculate,
 )
 
 _google_tool = Tool(
     name="Google",
     description="A search engine for the internet. Should only be used if the search engine for the . Useful for when you need to answer questions about current events. Input should be a search query.",
-    func=SerpAPIWrapper().run,
-    coroutine=SerpAPIWrapper().arun,
+    func=lambda query: _serpapi.get().run(query),
+    coroutine=_agoogle,
 )
 
 _wolfram_tool = Tool(
     name="Wolfram Alpha",
     description="A wrapper around Wolfram Alpha. Useful for when you need to answer questions about Math, Science, Technology, Culture, Society and Everyday Life. Input should be a search query.",
-    func=WolframAlphaAPIWrapper().run,
+    func=lambda query: _wolfram.get().run(query),
+    coroutine=_awolfram,
 )
 
 _RE_COMBINE_WHITESPACE = re.compile(r"\s+")
@@ -84,23 +197,260 @@ _SOUND_SAMPLE_RATE = 16000
 
 _sound_sample_length = 15
 
-_transcriber_processor = None
+_stream_step_length = 2
+
+_stream_chunk_length = 10
+
+_stream_overlap_length = 2
+
+_vad_frame_length = 0.1
+
+_vad_threshold = -50.0
+
+_vad_min_silence_length = 0.6
+
+_vad_min_speech_length = 0.3
+
+# Whisper pads every clip to 30 seconds, so a pause only ends a segment once
+# it holds this many seconds.
+_vad_min_segment_length = 8.0
+
+# A pause this long ends a segment of any length, so speech followed by
+# silence isn't held back until someone talks again.
+_vad_max_silence_length = 3.0
+
+_transcriber_batch_size = 4
+
+_transcriber_max_wait = 1.0
+
+_summary_group_size = 3
 
-_transcriber_model = None
+_summary_max_tokens = 256
+
+# Summaries are reduced in groups of this many until at most this many remain.
+_summary_fan_in = 8
+
+_autosave_interval = 10.0
+
+_autosave_max_changes = 256
 
 
 def _load_transcriber():
+    # Imported here so that torch and transformers are only loaded once a
+    # transcriber is actually needed.
+    from Kairos.transcribers import load_transcriber
+
     logging.debug(
-        f"Initializing transcriber thread: loading model {_TRANSCRIBER_MODEL=}"
+        f"Initializing transcriber thread: loading {_TRANSCRIBER_BACKEND=} {_TRANSCRIBER_SIZE=} {_TRANSCRIBER_QUANTIZE=} {_TRANSCRIBER_THREADS=}"
     )
 
-    global _transcriber_processor, _transcriber_model
-
-    _transcriber_processor = WhisperProcessor.from_pretrained(_TRANSCRIBER_MODEL)
-    _transcriber_model = WhisperForConditionalGeneration.from_pretrained(
-        _TRANSCRIBER_MODEL
+    return load_transcriber(
+        backend=_TRANSCRIBER_BACKEND,
+        size=_TRANSCRIBER_SIZE,
+        num_threads=int(_TRANSCRIBER_THREADS) if _TRANSCRIBER_THREADS else None,
+        # Unset, each backend picks its own default: int8 for ctranslate2.
+        quantize=_TRANSCRIBER_QUANTIZE == "true" if _TRANSCRIBER_QUANTIZE else None,
     )
-    _transcriber_model.config.forced_decoder_ids = None
+
+
+_transcriber = Lazy("transcriber", _load_transcriber)
+
+_RESOURCES = [_splitter, _embeddings, _serpapi, _wolfram, _transcriber]
+
+# Loading Whisper pulls in torch, so unless asked for, the transcriber is left
+# to the first live source instead of slowing down every server start.
+_WARM_UP_RESOURCES = [_splitter, _embeddings] + (
+    [_transcriber] if _TRANSCRIBER_WARM_UP else []
+)
+
+
+def warm_up(callback: Optional[Callable[[str], None]] = None) -> threading.Thread:
+    def _warm_up():
+        for resource in _WARM_UP_RESOURCES:
+            logging.debug(f"Warming up resource: {resource.name=}")
+
+            try:
+                resource.get()
+            except Exception:
+                logging.exception(f"Failed to warm up resource {resource.name}")
+                continue
+
+            if callback is not None:
+                callback(resource.name)
+
+    thread = threading.Thread(target=_warm_up, daemon=True)
+    thread.start()
+
+    return thread
+
+
+def readiness() -> Dict[str, bool]:
+    return {resource.name: resource.ready for resource in _RESOURCES}
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    return _embeddings.get().cache.stats()
+
+
+def _stream_pdf(origin: str) -> Iterator[Document]:
+    # Same documents as PagedPDFSplitter.load, yielded one page at a time.
+    import pypdf
+
+    with open(origin, "rb") as file:
+        reader = pypdf.PdfReader(file)
+        for i, page in enumerate(reader.pages):
+            yield Document(
+                page_content=page.extract_text(),
+                metadata={"source": origin, "page": i},
+            )
+
+
+_SOURCE_TYPE_TO_STREAM = {
+    "pdf": _stream_pdf,
+}
+
+
+def _stream_documents(type: str, origin: str) -> Iterator[Document]:
+    if type in _SOURCE_TYPE_TO_STREAM:
+        yield from _SOURCE_TYPE_TO_STREAM[type](origin)
+    else:
+        yield from _SOURCE_TYPE_TO_LOADER[type](origin).load()
+
+
+def _expand_sources(items: List[Dict[str, str]]) -> List[Tuple[str, str]]:
+    # Expands folders into the PDFs they contain and drops repeated entries.
+    expanded = []
+    for item in items:
+        type = item["type"]
+        origin = item["origin"].strip()
+
+        if type == "pdf" and os.path.isdir(origin):
+            expanded.extend(
+                ("pdf", str(path)) for path in sorted(Path(origin).glob("*.pdf"))
+            )
+        else:
+            expanded.append((type, origin))
+
+    return list(dict.fromkeys(expanded))
+
+
+def _merge_overlap(previous: str, current: str, max_words: int = 16) -> str:
+    # Drops the words at the start of `current` that repeat the end of
+    # `previous`, i.e. the words spoken during the overlapping audio.
+    def _normalize(word: str) -> str:
+        return re.sub(r"[^\w]", "", word).lower()
+
+    previous_words = [_normalize(word) for word in previous.split()]
+    current_words = current.split()
+    normalized = [_normalize(word) for word in current_words]
+
+    for k in range(min(max_words, len(previous_words), len(current_words)), 0, -1):
+        if previous_words[-k:] == normalized[:k]:
+            return " ".join(current_words[k:])
+
+    return current
+
+
+class VoiceActivityDetector:
+    threshold: float
+    min_silence_length: float
+    min_speech_length: float
+    min_length: float
+    max_length: float
+
+    _frames: List[numpy.ndarray]
+    _speech_length: float
+    _silence_length: float
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        min_silence_length: Optional[float] = None,
+        min_speech_length: Optional[float] = None,
+        min_length: Optional[float] = None,
+        max_length: Optional[float] = None,
+    ):
+        if threshold is None:
+            threshold = _vad_threshold
+
+        if min_silence_length is None:
+            min_silence_length = _vad_min_silence_length
+
+        if min_speech_length is None:
+            min_speech_length = _vad_min_speech_length
+
+        if min_length is None:
+            min_length = _vad_min_segment_length
+
+        if max_length is None:
+            max_length = _sound_sample_length
+
+        self.threshold = threshold
+        self.min_silence_length = min_silence_length
+        self.min_speech_length = min_speech_length
+        self.min_length = min(min_length, max_length)
+        self.max_length = max_length
+
+        self._reset()
+
+    def _reset(self):
+        self._frames = []
+        self._speech_length = 0.0
+        self._silence_length = 0.0
+
+    def is_speech(self, frame: numpy.ndarray) -> bool:
+        rms = numpy.sqrt(numpy.mean(numpy.square(frame)))
+        return 20 * numpy.log10(rms + 1e-10) > self.threshold
+
+    def contains_speech(self, data: numpy.ndarray) -> bool:
+        frame = int(_SOUND_SAMPLE_RATE * _vad_frame_length)
+        return any(
+            self.is_speech(data[i : i + frame]) for i in range(0, len(data), frame)
+        )
+
+    def push(self, frame: numpy.ndarray) -> Optional[numpy.ndarray]:
+        # Accumulates frames into a segment and returns it once it holds
+        # `min_length` seconds and speech is followed by `min_silence_length`
+        # seconds of silence, or once it reaches `max_length` seconds. Silence
+        # before speech, and past a pause in a segment still too short to
+        # end, is dropped, unless the pause lasts `_vad_max_silence_length`.
+        speech = self.is_speech(frame)
+
+        if not self._frames and not speech:
+            return None
+
+        length = len(frame) / _SOUND_SAMPLE_RATE
+        if speech:
+            self._speech_length += length
+            self._silence_length = 0.0
+        else:
+            paused = self._silence_length >= self.min_silence_length
+            self._silence_length += length
+            if paused:
+                if self._silence_length >= _vad_max_silence_length:
+                    return self.flush()
+                return None
+
+        self._frames.append(frame)
+
+        total = sum(len(frame) for frame in self._frames) / _SOUND_SAMPLE_RATE
+        if total >= self.max_length or (
+            self._silence_length >= self.min_silence_length
+            and total >= self.min_length
+        ):
+            return self.flush()
+
+        return None
+
+    def flush(self) -> Optional[numpy.ndarray]:
+        frames = self._frames
+        speech_length = self._speech_length
+        self._reset()
+
+        if speech_length < self.min_speech_length:
+            return None
+
+        return numpy.concatenate(frames)
 
 
 class Source(BaseModel):
@@ -141,6 +491,9 @@ class RecorderThread(threading.Thread):
     type: str
     origin: str
     offset: int
+    next_index: int
+    streaming: bool
+    vad: bool
 
     _chunk_size: int
     _chunk_overlap: int
@@ -159,10 +512,14 @@ class RecorderThread(threading.Thread):
         type: str,
         origin: str,
         offset: int = 0,
+        streaming: bool = False,
+        vad: bool = True,
     ):
         super().__init__()
 
-        logging.debug(f"Initializing recorder thread: {notebook=}")
+        logging.debug(
+            f"Initializing recorder thread: {notebook=}, {streaming=}, {vad=}"
+        )
 
         self.notebook = notebook
         self.to_transcribe_queue = to_transcribe_queue
@@ -170,6 +527,10 @@ class RecorderThread(threading.Thread):
         self.type = type
         self.origin = origin
         self.offset = offset
+        # One past the last final chunk queued, for the next session to resume.
+        self.next_index = offset
+        self.streaming = streaming
+        self.vad = vad
 
         self._stop = threading.Event()
 
@@ -187,100 +548,265 @@ class RecorderThread(threading.Thread):
     def stopped(self):
         return self._stop.is_set()
 
+    def _put(
+        self,
+        _index: int,
+        data: numpy.ndarray,
+        partial: bool = False,
+        overlap: bool = False,
+    ):
+        if not partial:
+            self.next_index = max(self.next_index, _index + 1)
+
+        self.to_transcribe_queue.put(
+            {
+                "id": self.id,
+                "type": self.type,
+                "origin": self.origin,
+                "_index": _index,
+                "data": data,
+                "partial": partial,
+                "overlap": overlap,
+            }
+        )
+
+    def _record_blocks(self, recorder):
+        for i in itertools.count(self.offset):
+            if self.stopped():
+                logging.debug("Recorder thread stopped")
+                return
+
+            data = recorder.record(numframes=_SOUND_SAMPLE_RATE * _sound_sample_length)
+
+            self._put(i, data)
+
+    def _record_segments(self, recorder):
+        vad = VoiceActivityDetector()
+        frame = int(_SOUND_SAMPLE_RATE * _vad_frame_length)
+        i = self.offset
+
+        while True:
+            if self.stopped():
+                segment = vad.flush()
+                if segment is not None:
+                    self._put(i, segment)
+
+                logging.debug("Recorder thread stopped")
+                return
+
+            segment = vad.push(recorder.record(numframes=frame))
+            if segment is not None:
+                logging.debug(f"Detected speech segment: {len(segment)=}")
+                self._put(i, segment)
+                i += 1
+
+    def _record_stream(self, recorder):
+        # Every `_stream_step_length` seconds the window recorded so far is
+        # sent as a partial hypothesis. Once it spans `_stream_chunk_length`
+        # seconds it is sent as final and its last `_stream_overlap_length`
+        # seconds are carried over as the start of the next window. With VAD
+        # enabled, silent steps are skipped and a silent step after speech
+        # finalizes the window early.
+        vad = VoiceActivityDetector() if self.vad else None
+        step = int(_SOUND_SAMPLE_RATE * _stream_step_length)
+        chunk = int(_SOUND_SAMPLE_RATE * _stream_chunk_length)
+        overlap = int(_SOUND_SAMPLE_RATE * _stream_overlap_length)
+
+        empty = numpy.zeros((0, 1), dtype=numpy.float32)
+        prefix = empty
+        pending = []
+        i = self.offset
+
+        while True:
+            if self.stopped():
+                # The window was only sent as partial so far.
+                if pending:
+                    window = numpy.concatenate([prefix, *pending])
+                    self._put(i, window, partial=False, overlap=len(prefix) > 0)
+
+                logging.debug("Recorder thread stopped")
+                return
+
+            data = recorder.record(numframes=step)
+            speech = vad is None or vad.contains_speech(data)
+
+            if not speech and not pending:
+                prefix = empty
+                continue
+
+            if speech:
+                pending.append(data)
+
+            window = numpy.concatenate([prefix, *pending])
+            final = not speech or len(window) - len(prefix) >= chunk
+
+            self._put(i, window, partial=not final, overlap=len(prefix) > 0)
+
+            if final:
+                prefix = window[len(window) - overlap :] if speech else empty
+                pending = []
+                i += 1
+
     def run(self):
         with self._loopback.recorder(
             samplerate=_SOUND_SAMPLE_RATE, channels=1
         ) as recorder:
-            for i in itertools.count(self.offset):
-                if self.stopped():
-                    logging.debug("Recorder thread stopped")
-                    return
-
-                data = recorder.record(
-                    numframes=_SOUND_SAMPLE_RATE * _sound_sample_length
-                )
-
-                self.to_transcribe_queue.put(
-                    {
-                        "id": self.id,
-                        "type": self.type,
-                        "origin": self.origin,
-                        "_index": i,
-                        "data": data,
-                    }
-                )
+            if self.streaming:
+                self._record_stream(recorder)
+            elif self.vad:
+                self._record_segments(recorder)
+            else:
+                self._record_blocks(recorder)
 
 
 # TODO: Consider hosting this in the cloud
 class TranscriberThread(threading.Thread):
     notebook: "Notebook"
     to_transcribe_queue: queue.Queue
+    batch_size: int
+    max_wait: float
 
     _stop: threading.Event
+    _drain: bool
+    _last_final: Dict[str, str]
 
     def __init__(
         self,
         notebook: "Notebook",
         to_transcribe_queue: queue.Queue,
+        batch_size: Optional[int] = None,
+        max_wait: Optional[float] = None,
     ):
         super().__init__()
 
         logging.debug(f"Initializing transcriber thread: {notebook=}")
 
+        if batch_size is None:
+            batch_size = _transcriber_batch_size
+
+        if max_wait is None:
+            max_wait = _transcriber_max_wait
+
         self.notebook = notebook
         self.to_transcribe_queue = to_transcribe_queue
+        self.batch_size = batch_size
+        self.max_wait = max_wait
 
         self._stop = threading.Event()
+        self._drain = False
+        self._last_final = {}
 
-        if _transcriber_processor is None or _transcriber_model is None:
-            _load_transcriber()
-
-    def stop(self):
-        logging.debug("Stopping transcriber thread")
+    def stop(self, drain: bool = False):
+        # With drain, clips already queued are transcribed and indexed first.
+        logging.debug(f"Stopping transcriber thread: {drain=}")
+        self._drain = drain
         self._stop.set()
 
     def stopped(self):
         return self._stop.is_set()
 
-    # TODO: Batching
+    def _next_batch(self) -> List[Dict]:
+        # Blocks until at least one clip is pending, then keeps draining the
+        # queue until the batch is full or `max_wait` seconds have passed.
+        try:
+            items = [self.to_transcribe_queue.get(timeout=self.max_wait)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+
+            try:
+                items.append(self.to_transcribe_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+
+        return items
+
+    def _transcribe(self, items: List[Dict]) -> List[str]:
+        return _transcriber.get().transcribe([item["data"].flatten() for item in items])
+
+    @staticmethod
+    def _drop_stale_partials(items: List[Dict]) -> List[Dict]:
+        # A partial window is superseded by any later window of the same
+        # chunk, so only the newest one per chunk is worth transcribing.
+        latest = {}
+        for item in items:
+            latest[(item["id"], item["_index"])] = item
+
+        return [
+            item
+            for item in items
+            if not item.get("partial", False)
+            or latest[(item["id"], item["_index"])] is item
+        ]
+
     def run(self):
         while True:
-            if self.stopped():
+            if self.stopped() and (
+                not self._drain or self.to_transcribe_queue.empty()
+            ):
                 logging.debug("Transcriber thread stopped")
                 return
 
-            item = self.to_transcribe_queue.get()
-            id = item["id"]
-            type = item["type"]
-            origin = item["origin"]
-            _index = item["_index"]
-            data = item["data"]
-
-            input_features = _transcriber_processor(
-                audio=data.flatten(),
-                sampling_rate=_SOUND_SAMPLE_RATE,
-                return_tensors="pt",
-            ).input_features
-
-            predicted_ids = _transcriber_model.generate(input_features)
-
-            transcription = _transcriber_processor.batch_decode(
-                predicted_ids, skip_special_tokens=True
-            )[0]
-
-            doc = Document(
-                page_content=transcription,
-                metadata={
-                    "_index": _index,
-                    "type": type,
-                    "origin": origin,
-                },
-            )
+            items = self._drop_stale_partials(self._next_batch())
+            if not items:
+                continue
+
+            logging.debug(f"Transcribing batch: {len(items)=}")
+
+            transcriptions = self._transcribe(items)
+
+            docs_by_source: Dict[str, List[Document]] = {}
+            for item, transcription in sorted(
+                zip(items, transcriptions), key=lambda pair: pair[0]["_index"]
+            ):
+                id = item["id"]
+                _index = item["_index"]
+                transcription = transcription.strip()
+
+                if not transcription:
+                    logging.debug(f"Skipping empty transcription: {id=}, {_index=}")
+                    continue
+
+                if item.get("partial", False):
+                    self.notebook._emit(
+                        "transcription_partial",
+                        {"source_id": id, "_index": _index, "text": transcription},
+                        key=f"transcription_partial:{id}",
+                    )
+                    continue
+
+                if item.get("overlap", False) and id in self._last_final:
+                    merged = _merge_overlap(self._last_final[id], transcription)
+                else:
+                    merged = transcription
+                self._last_final[id] = transcription
+
+                doc = Document(
+                    page_content=merged,
+                    metadata={
+                        "_index": _index,
+                        "type": item["type"],
+                        "origin": item["origin"],
+                    },
+                )
 
-            logging.debug(f"Transcribed: {doc=}")
+                logging.debug(f"Transcribed: {doc=}")
 
-            ids = self.notebook._add_docs([doc])
-            self.notebook.add_ids_to_live_source(id, ids)
+                self.notebook._emit(
+                    "transcription",
+                    {"source_id": id, "_index": _index, "text": merged},
+                )
+
+                docs_by_source.setdefault(id, []).append(doc)
+
+            for id, docs in docs_by_source.items():
+                ids = self.notebook._add_docs(docs)
+                self.notebook.add_ids_to_live_source(id, ids, docs)
 
 
 # TODO: Implement
@@ -309,7 +835,69 @@ class IntelligenceThread(threading.Thread):
         pass
 
 
+class PersisterThread(threading.Thread):
+    notebook: "Notebook"
+    interval: float
+    max_changes: int
+
+    _stop: threading.Event
+
+    def __init__(
+        self,
+        notebook: "Notebook",
+        interval: Optional[float] = None,
+        max_changes: Optional[int] = None,
+    ):
+        super().__init__(daemon=True)
+
+        if interval is None:
+            interval = _autosave_interval
+
+        if max_changes is None:
+            max_changes = _autosave_max_changes
+
+        self.notebook = notebook
+        self.interval = interval
+        self.max_changes = max_changes
+
+        self._stop = threading.Event()
+
+    def stop(self):
+        logging.debug("Stopping persister thread")
+        self._stop.set()
+        with self.notebook._changes_cond:
+            self.notebook._changes_cond.notify_all()
+
+    def stopped(self):
+        return self._stop.is_set()
+
+    def run(self):
+        # Write-behind: changes are flushed once enough pile up or when the
+        # interval passes, and once more on stop.
+        while True:
+            with self.notebook._changes_cond:
+                self.notebook._changes_cond.wait_for(
+                    lambda: self.stopped()
+                    or self.notebook._changes >= self.max_changes,
+                    self.interval,
+                )
+                changes = self.notebook._changes
+
+            if changes:
+                try:
+                    self.notebook._flush()
+                except Exception:
+                    logging.exception("Failed to autosave notebook")
+                    # The changes are still pending: retried after a pause
+                    # rather than right away.
+                    self._stop.wait(self.interval)
+
+            if self.stopped():
+                break
+
+
 class Notebook:
+    id: str
     name: str
     path: Optional[str]
     sources: List[Source]
@@ -322,24 +910,61 @@ class Notebook:
     _to_transcribe_queue: Optional[queue.Queue]
 
     _live_sources_threads: Dict[str, RecorderThread]
+    _live_sources_next_index: Dict[str, int]
+
+    _sources_by_id: Dict[str, Source]
+    _live_sources_by_id: Dict[str, Source]
+    _live_sources_by_origin: Dict[str, Source]
+    _chunks: Dict[str, List[Tuple[int, str]]]
+    _doc_rows: Dict[str, int]
+
+    _summaries: Dict[str, str]
 
     _faiss: Optional[FAISS]
+    _index_version: int
+    _search_cache: SearchCache
     _tools: List[Tool]
     _agent: ZeroShotAgent
 
     _conversational_memory: ConversationBufferMemory
     _conversational_agent: ConversationalAgent
 
+    _index_lock: RWLock
+    _conversation_lock: RWLock
+    _generations_lock: RWLock
+    _chat_lock: threading.Lock
+    _achat_lock: Optional[asyncio.Lock]
+    _live_sources_lock: threading.Lock
+
     _emitter: EventEmitter
 
+    _store: Optional[NotebookStore]
+    _save_lock: threading.Lock
+    _changes: int
+    _changes_cond: threading.Condition
+    _persister_thread: Optional[PersisterThread]
+    _rebuild_lock: threading.Lock
+
     def __init__(
-        self, name: str = None, path: Optional[str] = None, verbose: bool = False
+        self,
+        name: str = None,
+        path: Optional[str] = None,
+        verbose: bool = False,
+        id: Optional[str] = None,
+        emitter: Optional[EventEmitter] = None,
     ):
         logging.debug(f"Initializing notebook: {name=}, {path=}, {verbose=}")
 
         if name is None:
             name = generate_name()
 
+        if id is None:
+            id = uuid()
+
+        if emitter is None:
+            emitter = EventEmitter()
+
+        self.id = id
         self.name = name
         self.path = path
         self.sources = []
@@ -348,7 +973,21 @@ class Notebook:
         self.content = None
         self.generations = []
 
+        # Lookups over sources and chunks, kept under the index lock.
+        self._sources_by_id = {}
+        self._live_sources_by_id = {}
+        self._live_sources_by_origin = {}
+        self._chunks = {}
+        self._doc_rows = {}
+
+        # Summaries of chunk groups and of groups of summaries, keyed by the
+        # chunk ids they cover.
+        self._summaries = {}
+
         self._faiss = None
+        # Bumped whenever search results may change.
+        self._index_version = 0
+        self._search_cache = SearchCache(_SEARCH_CACHE_SIZE, _SEARCH_CACHE_THRESHOLD)
         self._tools = [self._search_tool, _calculator_tool, _google_tool, _wolfram_tool]
 
         logging.debug(
@@ -359,6 +998,7 @@ class Notebook:
             tools=self._tools,
             agent=_AGENT,
             verbose=verbose,
+            callback_manager=_callback_manager,
         )
         self._agent.return_intermediate_steps = True
 
@@ -374,20 +1014,46 @@ class Notebook:
             agent=_CONVERSATIONAL_AGENT,
             verbose=verbose,
             memory=self._conversational_memory,
+            callback_manager=_callback_manager,
         )
 
+        # The index lock covers the FAISS index and the sources' id lists.
+        # LLM and agent calls never run while holding a write lock, so reads
+        # don't wait on in-flight generations.
+        self._index_lock = RWLock()
+        self._conversation_lock = RWLock()
+        self._generations_lock = RWLock()
+        self._chat_lock = threading.Lock()
+        # Created on first use, inside the loop that awaits it.
+        self._achat_lock = None
+        self._live_sources_lock = threading.Lock()
+
         self._to_transcribe_queue = None
         self._transcriber_thread = None
 
         self._live_sources_threads = {}
+        self._live_sources_next_index = {}
 
-        self._emitter = EventEmitter()
+        self._emitter = emitter
+
+        self._store = None
+        self._save_lock = threading.Lock()
+        self._changes = 0
+        self._changes_cond = threading.Condition()
+        # Held by the background index rebuild while it runs.
+        self._rebuild_lock = threading.Lock()
 
         self._intelligence_thread = None
         self._ensure_intelligence()
 
+        # A stored notebook is still being loaded; load starts the persister
+        # once its store is attached.
+        self._persister_thread = None
+        if path is not None and not NotebookStore.exists(path):
+            self._ensure_persister()
+
     @classmethod
-    def load(cls, path: Optional[str] = None) -> "Notebook":
+    def load(cls, path: Optional[str] = None, **kwargs) -> "Notebook":
         logging.debug(f"Loading notebook: {path=}")
 
         if path is None:
@@ -397,33 +1063,56 @@ class Notebook:
             raise ValueError("No path provided")
 
         _path = Path(path)
-        _json = json.load(open(_path / "notebook.json", "r"))
 
-        notebook = cls(name=_json["name"], path=path)
-        notebook.sources = [Source(**source) for source in _json["sources"]]
-        notebook.live_sources = [Source(**source) for source in _json["live_sources"]]
+        # Notebooks saved before the incremental store only have notebook.json
+        # and a pickled index; they move to the store on their next save.
+        store = None
+        if NotebookStore.exists(path):
+            store = NotebookStore(path)
+            _json = store.load()
+        else:
+            _json = json.load(open(_path / "notebook.json", "r"))
+
+        indexed = (
+            store.rows > 0 if store is not None else (_path / "index.faiss").exists()
+        )
+        model = _json.get("embeddings_model") or _LEGACY_EMBEDDINGS_MODEL
+        if indexed and model != _embeddings.get().document_model:
+            raise ValueError(
+                f"{path} was indexed with {model}, "
+                f"not the configured {_embeddings.get().document_model}"
+            )
+
+        notebook = cls(name=_json["name"], path=path, **kwargs)
+        for source in _json["sources"]:
+            notebook._register_source(Source(**source))
+        for source in _json["live_sources"]:
+            notebook._register_source(Source(**source), live=True)
         notebook.conversation = [
             Message(**message) for message in _json["conversation"]
         ]
         notebook.content = _json["content"]
         notebook.generations = [
-            Generation(
-                id=generation["id"],
-                type=generation["type"],
-                input=generation["input"],
-                output=generation["output"],
-                intermediate_steps=[
-                    Step(action=Action(**step["action"]), result=step["result"])
-                    for step in generation["intermediate_steps"]
-                ],
-            )
-            for generation in _json["generations"]
+            Generation(**generation) for generation in _json["generations"]
         ]
 
         logging.debug(f"Loading FAISS index: {path=}, {_embeddings=}")
 
-        if os.path.exists(_path / "index.faiss"):
-            notebook._faiss = FAISS.load_local(path, _embeddings)
+        if store is not None:
+            notebook._store = store
+            notebook._faiss = store.load_index(_embeddings.get().embed_query)
+        elif os.path.exists(_path / "index.faiss"):
+            notebook._faiss = FAISS.load_local(path, _embeddings.get())
+            notebook._doc_rows = {
+                doc_id: row
+                for row, doc_id in notebook._faiss.index_to_docstore_id.items()
+            }
+
+        if notebook._faiss is not None:
+            tune(notebook._faiss.index, _INDEX_NPROBE, _INDEX_EF_SEARCH)
+            notebook._maybe_rebuild_index()
+
+        notebook._ensure_persister()
 
         return notebook
 
@@ -433,17 +1122,75 @@ class Notebook:
             name="Search",
             description="A search engine for the relevant knowledge database. Use this tool before using Google. Search for a topic and get the most relevant documents. Input should be a search query.",
             func=self._search_tool_func,
+            coroutine=self._asearch_tool_func,
         )
 
     @property
     def running_live_sources(self) -> List[str]:
         return list(self._live_sources_threads.keys())
 
+    def _emit(self, event: str, data: Any, key: Optional[str] = None):
+        # Events sharing a key are coalesced for listeners that fall behind.
+        self._emitter.emit(
+            self.id, EventEmitter.format_sse(json.dumps(data), event), key=key
+        )
+
+    @contextlib.contextmanager
+    def _stream(self, type: str) -> Iterator[str]:
+        # Streams tokens, agent actions and tool observations produced on this
+        # thread as generation_* events tagged with the generation's id.
+        id = uuid()
+
+        def _emit(event: str, data: Dict):
+            self._emit(
+                f"generation_{event}", {"generation_id": id, "type": type, **data}
+            )
+
+        _emit("start", {})
+        with stream_to(_emit):
+            yield id
+
+    def _end_stream(self, generation: Generation):
+        self._emit(
+            "generation_end",
+            {
+                "generation_id": generation.id,
+                "type": generation.type,
+                "output": generation.output,
+            },
+        )
+
     def _ensure_intelligence(self):
         if self._intelligence_thread is None:
             self._intelligence_thread = IntelligenceThread(self, self._emitter)
             self._intelligence_thread.start()
 
+    def _ensure_persister(self):
+        if self._persister_thread is None:
+            self._persister_thread = PersisterThread(self)
+            self._persister_thread.start()
+
+    def _mark_dirty(self, count: int = 1):
+        with self._changes_cond:
+            self._changes += count
+            self._changes_cond.notify_all()
+
+    def close(self):
+        # Stops the background threads in the order data flows through them:
+        # recorders queue their last segments, the transcriber indexes what
+        # was queued, and only then does the persister flush for good.
+        transcribers = [
+            self._stop_live_source(id) for id in list(self._live_sources_threads)
+        ]
+        for transcriber in transcribers:
+            if transcriber is not None:
+                transcriber.join()
+
+        if self._persister_thread is not None:
+            self._persister_thread.stop()
+            self._persister_thread.join()
+            self._persister_thread = None
+
     def _ensure_transcriber(self):
         if self._to_transcribe_queue is None:
             self._to_transcribe_queue = queue.Queue()
@@ -454,12 +1201,15 @@ class Notebook:
             )
             self._transcriber_thread.start()
 
-    def _stop_transcriber(self):
-        if self._transcriber_thread is not None:
-            self._transcriber_thread.stop()
+    def _stop_transcriber(self) -> Optional[TranscriberThread]:
+        thread = self._transcriber_thread
+        if thread is not None:
+            thread.stop(drain=True)
             self._transcriber_thread = None
             self._to_transcribe_queue = None
 
+        return thread
+
     def _search_tool_func(self, query: str) -> str:
         logging.debug(f"Running search tool: {query=}")
 
@@ -467,30 +1217,125 @@ class Notebook:
             logging.debug("No FAISS index for search tool: no source added yet")
             return "No source added yet."
 
-        docs = self._faiss.similarity_search(query, 2)
+        version = self._index_version
+        vector, output = self._search_cache.lookup(query, version)
+        if output is not None:
+            logging.debug(f"Search cache hit: {query=}")
+            return output
+
+        if vector is None:
+            vector = _embeddings.get().embed_query(query)
+            output = self._search_cache.nearest(query, vector, version)
+            if output is not None:
+                return output
+
+        with self._index_lock.read():
+            version = self._index_version
+            docs = self._faiss.similarity_search_by_vector(vector, 2)
         texts = [doc.page_content for doc in docs]
         texts = [_RE_COMBINE_WHITESPACE.sub(" ", text).strip() for text in texts]
 
         logging.debug(f"Search tool results: {texts=}")
 
         texts = [f'"""{text}"""' for text in texts if text]
-        return ", ".join(texts)
+        output = ", ".join(texts)
+
+        self._search_cache.put(query, vector, version, output)
 
-    def _add_docs(self, docs: List[Document]) -> List[str]:
+        return output
+
+    def search_cache_stats(self) -> Dict[str, Any]:
+        return self._search_cache.stats()
+
+    async def _asearch_tool_func(self, query: str) -> str:
+        # FAISS and the query embedding are blocking, so they run off the loop.
+        return await asyncio.to_thread(self._search_tool_func, query)
+
+    def _add_docs(
+        self, docs: List[Document], vectors: Optional[List[List[float]]] = None
+    ) -> List[str]:
         logging.debug(f"Adding docs: {docs=}")
 
-        if self._faiss is None:
-            logging.debug(f"Initializing FAISS index: {_embeddings=}")
-            self._faiss = FAISS.from_documents(docs, _embeddings)
-            ids = list(self._faiss.index_to_docstore_id.values())
-        else:
+        if not docs:
+            return []
+
+        # Embedded outside the lock and added to the index as is, rather than
+        # through `FAISS.add_texts`, which embeds every text again one by one.
+        if vectors is None:
+            vectors = _embeddings.get().embed_documents(
+                [doc.page_content for doc in docs]
+            )
+        vectors = numpy.array(vectors, dtype=numpy.float32)
+        ids = [uuid() for _ in docs]
+
+        with self._index_lock.write():
+            if self._faiss is None:
+                logging.debug(f"Initializing FAISS index: {_embeddings=}")
+                self._faiss = FAISS(
+                    _embeddings.get().embed_query,
+                    faiss.IndexFlatL2(vectors.shape[1]),
+                    InMemoryDocstore({}),
+                    {},
+                )
+            elif is_read_only(self._faiss.index):
+                # The memory-mapped snapshot can't take new rows.
+                self._faiss.index = self._store.read_snapshot()
+                tune(self._faiss.index, _INDEX_NPROBE, _INDEX_EF_SEARCH)
+
             logging.debug(f"Adding docs to FAISS index: {docs=}")
-            texts = [doc.page_content for doc in docs]
-            metadatas = [doc.metadata for doc in docs]
-            ids = self._faiss.add_texts(texts, metadatas)
+            start = self._faiss.index.ntotal
+            self._faiss.index.add(vectors)
+            self._faiss.docstore.add(dict(zip(ids, docs)))
+            self._faiss.index_to_docstore_id.update(
+                zip(range(start, start + len(ids)), ids)
+            )
+
+            self._doc_rows.update(zip(ids, range(start, start + len(ids))))
+            self._index_version += 1
+
+        self._mark_dirty(len(ids))
+        self._maybe_rebuild_index()
 
         return ids
 
+    def _maybe_rebuild_index(self):
+        with self._index_lock.read():
+            if self._faiss is None or not needs_rebuild(
+                self._faiss.index, _INDEX_TYPE, _INDEX_PROMOTE_ROWS
+            ):
+                return
+
+        if not self._rebuild_lock.acquire(blocking=False):
+            return
+
+        threading.Thread(target=self._rebuild_index, daemon=True).start()
+
+    def _rebuild_index(self):
+        # The new index is trained and filled from a copy of the vectors, so
+        # searches and inserts only wait for the swap.
+        try:
+            with self._index_lock.read():
+                rows = self._faiss.index.ntotal
+                vectors = self._faiss.index.reconstruct_n(0, rows)
+
+            logging.debug(f"Rebuilding index: {_INDEX_TYPE=}, {rows=}")
+
+            index = build_index(_INDEX_TYPE, vectors, _INDEX_NPROBE, _INDEX_EF_SEARCH)
+
+            with self._index_lock.write():
+                current = self._faiss.index
+                if current.ntotal > rows:
+                    index.add(current.reconstruct_n(rows, current.ntotal - rows))
+                self._faiss.index = index
+                # An approximate index can rank differently.
+                self._index_version += 1
+
+            self._emit("index_rebuilt", {"type": _INDEX_TYPE, "rows": index.ntotal})
+        except Exception:
+            logging.exception("Failed to rebuild index")
+        finally:
+            self._rebuild_lock.release()
+
     def to_dict(self) -> Dict:
         logging.debug("Converting notebook to dict")
 
@@ -504,16 +1349,20 @@ class Notebook:
         }
 
     def sources_to_dict(self) -> Dict:
-        return [source.dict() for source in self.sources]
+        with self._index_lock.read():
+            return [source.dict() for source in self.sources]
 
     def live_sources_to_dict(self) -> Dict:
-        return [source.dict() for source in self.live_sources]
+        with self._index_lock.read():
+            return [source.dict() for source in self.live_sources]
 
     def conversation_to_dict(self) -> Dict:
-        return [message.dict() for message in self.conversation]
+        with self._conversation_lock.read():
+            return [message.dict() for message in self.conversation]
 
     def generations_to_dict(self) -> Dict:
-        return [generation.dict() for generation in self.generations]
+        with self._generations_lock.read():
+            return [generation.dict() for generation in self.generations]
 
     def save(self, content: Any, path: Optional[str] = None):
         logging.debug(f"Saving notebook: {path=}")
@@ -527,151 +1376,591 @@ class Notebook:
         if path is not None:
             self.path = path
 
-        path = Path(self.path)
-
         self.content = content
 
-        if self._faiss is not None:
-            logging.debug(f"Saving FAISS index: {path=}")
-            self._faiss.save_local(self.path)
+        self._flush()
+        self._ensure_persister()
+
+    def _flush(self):
+        # Only what changed since the last save is written: new messages,
+        # generations, source ids and index rows are appended to the store.
+        with self._save_lock:
+            # Changes made while writing are left for the next flush, and
+            # none are forgotten if the write fails.
+            with self._changes_cond:
+                changes = self._changes
+
+            if self._store is None or self._store.path != self.path:
+                if NotebookStore.exists(self.path):
+                    raise ValueError(f"{self.path} already contains a notebook")
+                self._store = NotebookStore(self.path)
+
+            store = self._store
+
+            with self._index_lock.read():
+                delta = store.index_delta(self._faiss)
+                source_rows, id_rows = store.sources_delta(
+                    self.sources, self.live_sources
+                )
 
-        json.dump(
-            self.to_dict(),
-            open(path / "notebook.json", "w"),
-        )
+            with self._conversation_lock.read():
+                messages = self.conversation[store.messages :]
+
+            with self._generations_lock.read():
+                generations = self.generations[store.generations :]
+
+            store.append(
+                self.name,
+                self.content,
+                _embeddings.get().document_model,
+                source_rows,
+                id_rows,
+                messages,
+                generations,
+                delta,
+            )
+
+            with self._changes_cond:
+                self._changes -= changes
+
+            if self._faiss is not None and store.should_compact():
+                with self._index_lock.read():
+                    store.compact(self._faiss)
 
     def rename(self, name: str):
         logging.debug(f"Renaming notebook: {name=}")
 
         self.name = name
 
+        self._mark_dirty()
+
+    def _ingest_batch(self, id: str, docs: List[Document], progress: Dict[str, int]):
+        ids = self._add_docs(docs)
+
+        with self._index_lock.write():
+            self._extend_source(self.get_source(id), ids, docs)
+            progress["indexed"] += len(ids)
+
+        self._emit(
+            "source_progress",
+            {"source_id": id, **progress},
+            key=f"source_progress:{id}",
+        )
+
     def add_source(self, type: str, origin: str) -> str:
         logging.debug(f"Adding source: {type=}, {origin=}")
 
         if type not in _SOURCE_TYPE_TO_LOADER:
             raise ValueError(f"Unknown source type {type}")
 
-        loader = _SOURCE_TYPE_TO_LOADER[type](origin)
-        docs = loader.load()
-        docs = _splitter.split_documents(docs)
+        id = uuid()
+        with self._index_lock.write():
+            self._register_source(
+                Source(
+                    id=id,
+                    type=type,
+                    origin=origin,
+                    ids=[],
+                )
+            )
+        self._mark_dirty()
+
+        # Pages are split as they are loaded and every `_ingest_batch_size`
+        # chunks are embedded and indexed on a worker thread, so the first
+        # chunks are searchable while the rest of the source is still loading.
+        progress = {"loaded": 0, "split": 0, "indexed": 0}
+        futures = []
+        batch = []
+        try:
+            with ThreadPoolExecutor(max_workers=_ingest_workers) as executor:
+                for doc in _stream_documents(type, origin):
+                    chunks = _splitter.get().split_documents([doc])
+                    for chunk in chunks:
+                        chunk.metadata["_index"] = progress["split"]
+                        progress["split"] += 1
+                    progress["loaded"] += 1
+
+                    self._emit(
+                        "source_progress",
+                        {"source_id": id, **progress},
+                        key=f"source_progress:{id}",
+                    )
+
+                    batch.extend(chunks)
+                    while len(batch) >= _ingest_batch_size:
+                        futures.append(
+                            executor.submit(
+                                self._ingest_batch,
+                                id,
+                                batch[:_ingest_batch_size],
+                                progress,
+                            )
+                        )
+                        batch = batch[_ingest_batch_size:]
+
+                if batch:
+                    futures.append(
+                        executor.submit(self._ingest_batch, id, batch, progress)
+                    )
+
+                for future in futures:
+                    future.result()
+        except Exception:
+            # The executor has let every batch finish, so nothing extends the
+            # source any more.
+            self._remove_source(id)
+            raise
+
+        self._emit("source_added", {"source_id": id, **progress})
+
+        return id
+
+    def _load_source(self, type: str, origin: str) -> List[Document]:
+        if type not in _SOURCE_TYPE_TO_LOADER:
+            raise ValueError(f"Unknown source type {type}")
+
+        docs = _splitter.get().split_documents(list(_stream_documents(type, origin)))
 
         for i, doc in enumerate(docs):
             doc.metadata["_index"] = i
 
-        ids = self._add_docs(docs)
-        id = uuid()
-        self.sources.append(
-            Source(
-                id=id,
-                type=type,
-                origin=origin,
-                ids=ids,
+        return docs
+
+    def add_sources(self, items: List[Dict[str, str]]) -> List[Dict]:
+        logging.debug(f"Adding sources: {len(items)=}")
+
+        with self._index_lock.read():
+            existing = {
+                (source.type, source.origin): source.id for source in self.sources
+            }
+
+        statuses = []
+        for type, origin in _expand_sources(items):
+            status = {"type": type, "origin": origin, "status": "pending"}
+            if (type, origin) in existing:
+                status["status"] = "duplicate"
+                status["source_id"] = existing[(type, origin)]
+            statuses.append(status)
+
+        def _update(status: Dict, **kwargs):
+            status.update(kwargs)
+            self._emit(
+                "bulk_progress",
+                status,
+                key=f"bulk_progress:{status['type']}:{status['origin']}",
             )
-        )
-        return id
+
+        embedder = _embeddings.get()
+
+        # Sources are fetched and split concurrently. Their chunks are pooled
+        # into shared embedding batches, and each source is indexed as soon as
+        # every batch holding one of its chunks has been embedded.
+        loaders = ThreadPoolExecutor(max_workers=_bulk_workers)
+        embedders = ThreadPoolExecutor(max_workers=_ingest_workers)
+        pending = []
+        batches = {}
+        loaded = []
+
+        def _flush(force: bool = False):
+            nonlocal pending
+            while pending and (force or len(pending) >= _ingest_batch_size):
+                batch = pending[:_ingest_batch_size]
+                pending = pending[_ingest_batch_size:]
+
+                future = embedders.submit(
+                    embedder.embed_documents, [doc.page_content for _, doc in batch]
+                )
+                # Each source keeps the positions of its chunks in the batch,
+                # in the order of its documents.
+                positions = {}
+                for j, (i, _) in enumerate(batch):
+                    positions.setdefault(i, []).append(j)
+                for i, js in positions.items():
+                    batches.setdefault(i, []).append((future, js))
+
+        with loaders, embedders:
+            futures = {
+                loaders.submit(self._load_source, status["type"], status["origin"]): i
+                for i, status in enumerate(statuses)
+                if status["status"] == "pending"
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    docs = future.result()
+                except Exception as e:
+                    logging.exception(f"Failed to load source {statuses[i]['origin']}")
+                    _update(statuses[i], status="failed", error=str(e))
+                    continue
+
+                _update(statuses[i], status="loaded", chunks=len(docs))
+                loaded.append((i, docs))
+                pending.extend((i, doc) for doc in docs)
+                _flush()
+
+            _flush(force=True)
+
+            for i, docs in loaded:
+                try:
+                    vectors = [
+                        future.result()[j]
+                        for future, js in batches.get(i, [])
+                        for j in js
+                    ]
+                    ids = self._add_docs(docs, vectors)
+                except Exception as e:
+                    logging.exception(f"Failed to index source {statuses[i]['origin']}")
+                    _update(statuses[i], status="failed", error=str(e))
+                    continue
+
+                id = uuid()
+                with self._index_lock.write():
+                    self._register_source(
+                        Source(
+                            id=id,
+                            type=statuses[i]["type"],
+                            origin=statuses[i]["origin"],
+                            ids=ids,
+                        )
+                    )
+                self._mark_dirty()
+
+                _update(statuses[i], status="added", source_id=id)
+
+        return statuses
 
     # TODO: Add support for different types of live sources
-    def start_live_source(self, type: str, origin: str) -> str:
-        logging.debug(f"Starting live source: {type=}")
+    def start_live_source(
+        self, type: str, origin: str, streaming: bool = False, vad: bool = True
+    ) -> str:
+        logging.debug(f"Starting live source: {type=}, {streaming=}, {vad=}")
 
         if type != "sound":
             raise ValueError(f"Unknown live source type {type}")
 
-        if self.has_live_source(origin):
-            id = self.get_live_source_id(origin)
-            offset = len(self.get_live_source(origin).ids)
-        else:
-            id = uuid()
-            offset = 0
-
-        if id in self._live_sources_threads:
-            raise ValueError(f"Live source {id} is already running")
-
-        if not self.has_live_source(origin):
-            self.live_sources.append(
-                Source(
-                    id=id,
-                    type=type,
-                    origin=origin,
-                    ids=[],
-                )
+        with self._live_sources_lock:
+            if self.has_live_source(origin):
+                id = self.get_live_source_id(origin)
+                offset = self._next_live_index(id)
+            else:
+                id = uuid()
+                offset = 0
+
+            if id in self._live_sources_threads:
+                raise ValueError(f"Live source {id} is already running")
+
+            if not self.has_live_source(origin):
+                with self._index_lock.write():
+                    self._register_source(
+                        Source(
+                            id=id,
+                            type=type,
+                            origin=origin,
+                            ids=[],
+                        ),
+                        live=True,
+                    )
+                self._mark_dirty()
+
+            self._ensure_transcriber()
+
+            thread = RecorderThread(
+                self,
+                self._to_transcribe_queue,
+                id,
+                type,
+                origin,
+                offset,
+                streaming=streaming,
+                vad=vad,
             )
+            thread.start()
 
-        self._ensure_transcriber()
+            self._live_sources_threads[id] = thread
 
-        thread = RecorderThread(
-            self, self._to_transcribe_queue, id, type, origin, offset
-        )
-        thread.start()
+        return id
 
-        self._live_sources_threads[id] = thread
+    def _next_live_index(self, id: str) -> int:
+        # Chunk _index values have gaps where silence transcribed to nothing,
+        # so the count of chunks is no resume point.
+        with self._index_lock.read():
+            source = self.get_live_source(id)
+            self._source_chunks(source)
+            chunks = self._chunks[source.id]
+            indexed = chunks[-1][0] + 1 if chunks else 0
 
-        return id
+        return max(indexed, self._live_sources_next_index.get(id, 0))
 
     def stop_live_source(self, id: str):
+        self._stop_live_source(id)
+
+    def _stop_live_source(self, id: str) -> Optional[TranscriberThread]:
+        # Returns the transcriber if this was the last live source; it keeps
+        # running until it has drained its queue.
         logging.debug(f"Stopping live source: {id=}")
 
-        if id not in self._live_sources_threads:
-            raise ValueError(f"Live source {id} is not running")
+        with self._live_sources_lock:
+            if id not in self._live_sources_threads:
+                raise ValueError(f"Live source {id} is not running")
+
+            thread = self._live_sources_threads.pop(id)
+            thread.stop()
 
-        thread = self._live_sources_threads[id]
-        thread.stop()
+        # The recorder queues its last segment as it stops.
+        thread.join()
 
-        del self._live_sources_threads[id]
+        with self._live_sources_lock:
+            # Its clips may still be queued, so a restart resumes after them
+            # rather than after what is indexed so far.
+            self._live_sources_next_index[id] = thread.next_index
+
+            if not self._live_sources_threads:
+                return self._stop_transcriber()
+
+        return None
+
+    def _register_source(self, source: Source, live: bool = False):
+        # Callers adding to a live notebook hold the index write lock.
+        if live:
+            self.live_sources.append(source)
+            self._live_sources_by_id[source.id] = source
+            self._live_sources_by_origin[source.origin] = source
+        else:
+            self.sources.append(source)
+            self._sources_by_id[source.id] = source
+
+    def _remove_source(self, id: str):
+        # Chunks already indexed stay in the index, which only grows, but the
+        # source is dropped so the origin isn't reported as a duplicate later.
+        with self._save_lock:
+            with self._index_lock.write():
+                source = self._sources_by_id.pop(id, None)
+                if source is None:
+                    return
+
+                self.sources.remove(source)
+                self._chunks.pop(id, None)
+
+                if self._store is not None:
+                    self._store.remove_source(id)
+
+    def _extend_source(
+        self, source: Source, ids: List[str], docs: Optional[List[Document]] = None
+    ):
+        # Caller holds the index write lock.
+        source.ids.extend(ids)
+
+        chunks = self._chunks.get(source.id)
+        if chunks is None:
+            return
+
+        if docs is None:
+            # Order unknown: rebuilt from the docstore on next use.
+            del self._chunks[source.id]
+            return
+
+        for id, doc in zip(ids, docs):
+            bisect.insort(chunks, (doc.metadata["_index"], id))
+
+    def _source_chunks(self, source: Source) -> List[str]:
+        # A source's chunk ids in _index order. Ingestion batches can finish
+        # out of order, so source.ids isn't. Caller holds the index lock.
+        chunks = self._chunks.get(source.id)
+        if chunks is None:
+            chunks = sorted(
+                (self._faiss.docstore.search(doc_id).metadata["_index"], doc_id)
+                for doc_id in source.ids
+            )
+            self._chunks[source.id] = chunks
 
-        if not self._live_sources_threads:
-            self._stop_transcriber()
+        return [doc_id for _, doc_id in chunks]
+
+    def _doc_row(self, id: str) -> int:
+        # Caller holds the index lock.
+        row = self._doc_rows.get(id)
+        if row is None and self._store is not None:
+            row = self._store.get_row(id)
+        if row is None:
+            raise KeyError(id)
+        return row
 
     def get_source(self, id: str) -> Source:
-        try:
-            return next(source for source in self.sources if source.id == id)
-        except StopIteration:
-            return None
+        return self._sources_by_id.get(id)
 
     def get_live_source(self, id: str) -> Source:
-        try:
-            return next(source for source in self.live_sources if source.id == id)
-        except StopIteration:
-            return None
+        return self._live_sources_by_id.get(id)
 
     def has_live_source(self, origin: str) -> bool:
-        try:
-            return any(source.origin == origin for source in self.live_sources)
-        except StopIteration:
-            return False
+        return origin in self._live_sources_by_origin
 
     def get_live_source_id(self, origin: str) -> str:
-        return next(
-            source.id for source in self.live_sources if source.origin == origin
-        )
+        return self._live_sources_by_origin[origin].id
 
-    def add_ids_to_live_source(self, id: str, ids: List[str]):
+    def add_ids_to_live_source(
+        self, id: str, ids: List[str], docs: Optional[List[Document]] = None
+    ):
         logging.debug(f"Adding ids to live source: {id=}, {ids=}")
 
-        source = self.get_live_source(id)
-        source.ids.extend(ids)
+        with self._index_lock.write():
+            self._extend_source(self.get_live_source(id), ids, docs)
 
     def get_doc(self, id: str) -> Document:
-        return self._faiss.docstore.search(id)
+        with self._index_lock.read():
+            return self._faiss.docstore.search(id)
 
-    def get_content(self, id: str, live=False, last_k: Optional[int] = None) -> str:
-        if live:
-            source = self.get_live_source(id)
-        else:
-            source = self.get_source(id)
-        ids = sorted(
-            source.ids,
-            key=lambda doc_id: self.get_doc(doc_id).metadata["_index"],
-        )
+    def _get_docs(
+        self, id: str, live: bool = False, last_k: Optional[int] = None
+    ) -> List[Document]:
+        with self._index_lock.read():
+            if live:
+                source = self.get_live_source(id)
+            else:
+                source = self.get_source(id)
 
-        if last_k is not None:
-            ids = ids[-last_k:]
+            ids = self._source_chunks(source)
+            if last_k is not None:
+                ids = ids[-last_k:]
 
-        docs = [self.get_doc(id) for id in ids]
+            return [self._faiss.docstore.search(doc_id) for doc_id in ids]
+
+    def get_content(self, id: str, live=False, last_k: Optional[int] = None) -> str:
+        docs = self._get_docs(id, live=live, last_k=last_k)
         texts = [doc.page_content for doc in docs]
         texts = [_RE_COMBINE_WHITESPACE.sub(" ", text).strip() for text in texts]
         return " ".join(texts)
 
+    def _add_generation(self, generation: Generation):
+        with self._generations_lock.write():
+            self.generations.append(generation)
+
+        self._mark_dirty()
+
+        self._end_stream(generation)
+
+    def _add_message(self, sender: str, text: str):
+        with self._conversation_lock.write():
+            self.conversation.append(Message(id=uuid(), sender=sender, text=text))
+
+        self._mark_dirty()
+
+    @staticmethod
+    def _summary_key(parts: List[str]) -> str:
+        return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _summary_leaves(
+        self, id: str, last_k: Optional[int] = None, live=False
+    ) -> Tuple[List[Tuple[int, str, str]], List[str]]:
+        # Chunks are grouped from the start of the source, whatever last_k is,
+        # so a group's ids (and its cached summary) only change while it is
+        # the last, still filling, group.
+        with self._index_lock.read():
+            if live:
+                source = self.get_live_source(id)
+            else:
+                source = self.get_source(id)
+
+            ids = self._source_chunks(source)
+            start = 0
+            if last_k is not None:
+                start = max(0, len(ids) - last_k)
+                start -= start % _summary_group_size
+
+            docs = [self._faiss.docstore.search(doc_id) for doc_id in ids[start:]]
+
+        leaves = []
+        texts = []
+        for i in range(start, len(ids), _summary_group_size):
+            group = docs[i - start : i - start + _summary_group_size]
+            text = "".join(doc.page_content for doc in group)
+            text = _RE_COMBINE_WHITESPACE.sub(" ", text).strip()
+
+            key = self._summary_key(ids[i : i + _summary_group_size])
+            leaves.append((i // _summary_group_size, key, self._summary_prompt(text)))
+            texts.append(text)
+
+        return leaves, texts
+
+    def _summary_parents(
+        self, level: List[Tuple[int, str, str]]
+    ) -> List[Tuple[int, str, str]]:
+        # Groups are aligned on absolute positions, so new chunks only change
+        # the last node of each level.
+        groups = {}
+        for position, key, _ in level:
+            groups.setdefault(position // _summary_fan_in, []).append(key)
+
+        return [
+            (
+                position,
+                self._summary_key(["reduce", *keys]),
+                self._reduce_prompt("\n".join(self._summaries[key] for key in keys)),
+            )
+            for position, keys in groups.items()
+        ]
+
+    @staticmethod
+    def _summary_prompt(text: str) -> str:
+        return f'Summarize the following piece of text:\n\n"""{text}"""\n\nSummary:'
+
+    @staticmethod
+    def _reduce_prompt(text: str) -> str:
+        return (
+            "Combine the following summaries of consecutive parts of a text "
+            f'into a single summary:\n\n"""{text}"""\n\nSummary:'
+        )
+
+    def _summarize(self, level: List[Tuple[int, str, str]], stream: bool = False):
+        if not stream:
+            missing = [
+                (key, prompt) for _, key, prompt in level if key not in self._summaries
+            ]
+            texts = _llm.complete(
+                [prompt for _, prompt in missing], max_tokens=_summary_max_tokens
+            )
+            for (key, _), text in zip(missing, texts):
+                self._summaries[key] = text.strip()
+            return
+
+        for i, (_, key, prompt) in enumerate(level):
+            if i:
+                emit("token", {"token": "\n"})
+
+            if key in self._summaries:
+                emit("token", {"token": self._summaries[key]})
+                continue
+
+            (text,) = _llm.complete(
+                [prompt], stream=True, max_tokens=_summary_max_tokens
+            )
+            self._summaries[key] = text.strip()
+
+    async def _asummarize(
+        self, level: List[Tuple[int, str, str]], stream: bool = False
+    ):
+        if not stream:
+            missing = [
+                (key, prompt) for _, key, prompt in level if key not in self._summaries
+            ]
+            texts = await _llm.acomplete(
+                [prompt for _, prompt in missing], max_tokens=_summary_max_tokens
+            )
+            for (key, _), text in zip(missing, texts):
+                self._summaries[key] = text.strip()
+            return
+
+        for i, (_, key, prompt) in enumerate(level):
+            if i:
+                emit("token", {"token": "\n"})
+
+            if key in self._summaries:
+                emit("token", {"token": self._summaries[key]})
+                continue
+
+            (text,) = await _llm.acomplete(
+                [prompt], stream=True, max_tokens=_summary_max_tokens
+            )
+            self._summaries[key] = text.strip()
+
     def summary(
         self,
         id: str,
@@ -680,41 +1969,62 @@ class Notebook:
     ) -> str:
         logging.debug(f"Generating summary: {id=}, {last_k=}")
 
-        if live:
-            source = self.get_live_source(id)
-        else:
-            source = self.get_source(id)
-        ids = sorted(
-            source.ids,
-            key=lambda doc_id: self.get_doc(doc_id).metadata["_index"],
+        level, texts = self._summary_leaves(id, last_k=last_k, live=live)
+
+        # Only groups not summarized before go to the LLM. Lower levels are
+        # summarized silently, in batches; the last level is streamed, cached
+        # parts included, and joined into the response.
+        with call_type("summary"):
+            while len(level) > _summary_fan_in:
+                self._summarize(level)
+                level = self._summary_parents(level)
+
+            with self._stream("summary") as generation_id:
+                self._summarize(level, stream=True)
+
+        response = "\n".join(self._summaries[key] for _, key, _ in level).strip()
+
+        self._add_generation(
+            Generation(
+                id=generation_id,
+                type="run",
+                input="\n".join(texts),
+                output=response,
+            )
         )
 
-        if last_k is not None:
-            ids = ids[-last_k:]
+        return response
 
-        groups = [ids[i : i + 3] for i in range(0, len(ids), 3)]
-        texts = ["".join(self.get_doc(id).page_content for id in ids) for ids in groups]
-        texts = [_RE_COMBINE_WHITESPACE.sub(" ", text).strip() for text in texts]
-        prompts = [
-            f'Summarize the following piece of text:\n\n"""{text}"""\n\nSummary:'
-            for text in texts
-        ]
-        _llm.max_tokens = 256
-        result = _llm.generate(
-            prompts,
+    async def asummary(
+        self,
+        id: str,
+        last_k: Optional[int] = None,
+        live=False,
+    ) -> str:
+        logging.debug(f"Generating summary asynchronously: {id=}, {last_k=}")
+
+        level, texts = await asyncio.to_thread(
+            self._summary_leaves, id, last_k=last_k, live=live
         )
-        _llm.max_tokens = -1
-        summaries = [generation[0].text for generation in result.generations]
 
-        response = "\n".join(summaries).strip()
+        with call_type("summary"):
+            while len(level) > _summary_fan_in:
+                await self._asummarize(level)
+                level = self._summary_parents(level)
+
+            with self._stream("summary") as generation_id:
+                await self._asummarize(level, stream=True)
+
+        response = "\n".join(self._summaries[key] for _, key, _ in level).strip()
 
-        self.generations.append(
+        await asyncio.to_thread(
+            self._add_generation,
             Generation(
-                id=uuid(),
+                id=generation_id,
                 type="run",
                 input="\n".join(texts),
                 output=response,
-            )
+            ),
         )
 
         return response
@@ -743,9 +2053,25 @@ class Notebook:
         if content is not None:
             self.content = content
 
-        response = self._agent(prompt)
-        generation = self._format_generation("run", response)
-        self.generations.append(generation)
+        with self._stream("run") as generation_id:
+            response = self._agent(prompt)
+        generation = self._format_generation("run", response, id=generation_id)
+
+        self._add_generation(generation)
+
+        return generation.output
+
+    async def arun(self, prompt: str, content: str = None) -> str:
+        logging.debug(f"Running notebook asynchronously: {prompt=}")
+
+        if content is not None:
+            self.content = content
+
+        with self._stream("run") as generation_id:
+            response = await self._agent.acall(prompt)
+        generation = self._format_generation("run", response, id=generation_id)
+
+        await asyncio.to_thread(self._add_generation, generation)
 
         return generation.output
 
@@ -758,25 +2084,81 @@ class Notebook:
         raise NotImplementedError
 
     # TODO: Consider notebook content as a source.
-    def ideas(self, content: str = None) -> str:
-        texts = _splitter.split_text(content)
+    def _idea(self, prompt: str) -> str:
+        with call_type("ideas"):
+            return self._agent(prompt)["output"].strip()
+
+    @staticmethod
+    def _idea_key(idea: str) -> str:
+        idea = re.sub(r"[^\w\s]", "", idea.lower())
+        return _RE_COMBINE_WHITESPACE.sub(" ", idea).strip()
+
+    def ideas(self, content: str = None) -> List[str]:
+        texts = _splitter.get().split_text(content)
         texts = [texts[i : i + 3] for i in range(0, len(texts), 3)]
         texts = ["".join(text) for text in texts]
         texts = [_RE_COMBINE_WHITESPACE.sub(" ", text).strip() for text in texts]
+
+        if len(texts) > _ideas_max_groups:
+            picks = numpy.linspace(0, len(texts) - 1, _ideas_max_groups)
+            texts = [texts[i] for i in sorted(set(picks.round().astype(int)))]
+
         prompts = [
             f'Identify one possible idea you could write about to keep expanding this document: """{text}"""'
             for text in texts
         ]
-        self._agent.return_intermediate_steps = False
-        responses = self._agent.run(prompts)
-        self._agent.return_intermediate_steps = True
-
-        if type(responses) is not list:
-            responses = [responses]
 
-        self.generations.append(
+        # One agent run per group, a few at a time; each idea is streamed as
+        # a generation_idea event when its run finishes, duplicates skipped.
+        ideas = {}
+        seen = set()
+        errors = []
+        with self._stream("ideas") as generation_id:
+            with ThreadPoolExecutor(max_workers=_ideas_workers) as executor:
+                futures = {
+                    executor.submit(self._idea, prompt): i
+                    for i, prompt in enumerate(prompts)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        idea = future.result()
+                    except Exception as e:
+                        logging.exception(f"Failed to generate idea {i}")
+                        errors.append(e)
+                        continue
+
+                    ideas[i] = idea
+
+                    key = self._idea_key(idea)
+                    if not key or key in seen:
+                        continue
+                    seen.add(key)
+
+                    self._emit(
+                        "generation_idea",
+                        {
+                            "generation_id": generation_id,
+                            "type": "ideas",
+                            "index": i,
+                            "idea": idea,
+                        },
+                    )
+
+        if errors and not ideas:
+            raise errors[0]
+
+        responses = []
+        seen = set()
+        for i in sorted(ideas):
+            key = self._idea_key(ideas[i])
+            if key and key not in seen:
+                seen.add(key)
+                responses.append(ideas[i])
+
+        self._add_generation(
             Generation(
-                id=uuid(),
+                id=generation_id,
                 type="ideas",
                 input=content,
                 output="\n".join(responses),
@@ -789,49 +2171,68 @@ class Notebook:
     def chat(self, prompt: str) -> str:
         logging.debug(f"Running chat: {prompt=}")
 
-        self.conversation.append(
-            Message(
-                id=uuid(),
-                sender="Human",
-                text=prompt,
-            )
-        )
+        # The conversational agent's memory is shared, so chats on the same
+        # notebook take turns; the conversation itself stays readable.
+        with self._chat_lock:
+            self._add_message("Human", prompt)
+
+            with self._stream("chat") as generation_id:
+                response = self._conversational_agent.run(prompt).strip()
 
-        response = self._conversational_agent.run(prompt).strip()
+            self._add_message("AI", response)
 
-        self.conversation.append(
-            Message(
-                id=uuid(),
-                sender="AI",
-                text=response,
+        self._add_generation(
+            Generation(
+                id=generation_id,
+                type="chat",
+                input=prompt,
+                output=response,
             )
         )
 
-        self.generations.append(
+        return response
+
+    async def achat(self, prompt: str) -> str:
+        logging.debug(f"Running chat asynchronously: {prompt=}")
+
+        # Async chats take turns on their own lock; mixing chat and achat on
+        # one notebook isn't serialized.
+        if self._achat_lock is None:
+            self._achat_lock = asyncio.Lock()
+
+        # The notebook's locks are threading locks, so state is updated off
+        # the loop: a held write lock must not stall the server.
+        async with self._achat_lock:
+            await asyncio.to_thread(self._add_message, "Human", prompt)
+
+            with self._stream("chat") as generation_id:
+                response = (await self._conversational_agent.arun(prompt)).strip()
+
+            await asyncio.to_thread(self._add_message, "AI", response)
+
+        await asyncio.to_thread(
+            self._add_generation,
             Generation(
-                id=uuid(),
+                id=generation_id,
                 type="chat",
                 input=prompt,
                 output=response,
-            )
+            ),
         )
 
         return response
 
     def pca(self):
-        docstore_id_to_index = {
-            docstore_id: index
-            for index, docstore_id in self._faiss.index_to_docstore_id.items()
-        }
-
-        embeddings = []
-        texts = []
-        for source in self.sources:
-            for id in source.ids:
-                embeddings.append(
-                    self._faiss.index.reconstruct(docstore_id_to_index[id])
-                )
-                texts.append(self.get_doc(id).page_content)
+        # Imported here to keep sklearn out of the server's cold start.
+        from sklearn.manifold import TSNE
+
+        with self._index_lock.read():
+            embeddings = []
+            texts = []
+            for source in self.sources:
+                for id in source.ids:
+                    embeddings.append(self._faiss.index.reconstruct(self._doc_row(id)))
+                    texts.append(self._faiss.docstore.search(id).page_content)
 
         matrix = numpy.array(embeddings)
 
@@ -0,0 +1,130 @@
+import logging
+import threading
+import numpy
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class _Entry:
+    __slots__ = ("vector", "unit", "version", "results")
+
+    def __init__(self, vector: List[float]):
+        self.vector = vector
+        self.unit = numpy.asarray(vector, dtype=numpy.float32)
+        norm = numpy.linalg.norm(self.unit)
+        if norm:
+            self.unit = self.unit / norm
+        self.version = None
+        self.results = None
+
+
+class SearchCache:
+    max_size: int
+    threshold: Optional[float]
+    hits: int
+    semantic_hits: int
+    misses: int
+
+    _entries: "OrderedDict[str, _Entry]"
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int = 256, threshold: Optional[float] = None):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str, version: int) -> Tuple[Optional[List[float]], Any]:
+        # Returns the query's embedding if it has been seen, and results that
+        # are still valid for this index version, either its own or those of
+        # a near-duplicate query.
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is not None:
+                self._entries.move_to_end(query)
+
+                if entry.version == version:
+                    self.hits += 1
+                    return entry.vector, entry.results
+
+                results = self._nearest(entry, version)
+                if results is not None:
+                    self.semantic_hits += 1
+                    return entry.vector, results
+
+                self.misses += 1
+                return entry.vector, None
+
+        return None, None
+
+    def nearest(self, query: str, vector: List[float], version: int) -> Any:
+        # For a query seen for the first time, once it has been embedded.
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None:
+                entry = _Entry(vector)
+                self._entries[query] = entry
+                self._evict()
+
+            results = self._nearest(entry, version)
+            if results is not None:
+                self.semantic_hits += 1
+                return results
+
+            self.misses += 1
+            return None
+
+    def _nearest(self, entry: _Entry, version: int) -> Any:
+        if self.threshold is None:
+            return None
+
+        candidates = [
+            other
+            for other in self._entries.values()
+            if other.version == version and other is not entry
+        ]
+        if not candidates:
+            return None
+
+        similarities = numpy.stack([other.unit for other in candidates]) @ entry.unit
+        best = int(numpy.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+
+        logging.debug(f"Semantic search cache hit: {similarities[best]=}")
+
+        return candidates[best].results
+
+    def put(self, query: str, vector: List[float], version: int, results: Any):
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None:
+                entry = _Entry(vector)
+                self._entries[query] = entry
+            else:
+                self._entries.move_to_end(query)
+
+            entry.version = version
+            entry.results = results
+
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "threshold": self.threshold,
+            }
@@ -1,477 +1,510 @@
+import json
+import asyncio
 import threading
-import functools
+import uvicorn
 
-from collections import OrderedDict
-from typing import Dict, Optional
-from pydantic import BaseModel
-from flask import Flask, request, jsonify, Response
-from flask_cors import CORS
+from typing import Any, Dict, List, Optional
+from fastapi import Body, FastAPI, Header
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from tkinter import filedialog
 
-from Kairos.notebook import Notebook
+from Kairos.notebook import Notebook, warm_up, readiness, embedding_cache_stats
+from Kairos.llm import llm_stats, completion_cache_stats
+from Kairos.jobs import JobScheduler
 from Kairos.utils import EventEmitter, uuid
 
 
-app = Flask(__name__)
-CORS(app)
+app = FastAPI()
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 _notebooks: Dict[str, Notebook] = {}
 _notebooks_lock = threading.Lock()
 
-_jobs: Dict[str, OrderedDict[str, "Job"]] = {}
-_jobs_lock = threading.Lock()
-
 _emitter = EventEmitter()
 
+_scheduler = JobScheduler(
+    on_event=lambda notebook_id, event, job: _emitter.emit(
+        notebook_id,
+        EventEmitter.format_sse(json.dumps(job.dict(), default=str), f"job_{event}"),
+        key=f"job_progress:{job.id}" if event == "progress" else None,
+    )
+)
 
-class Job(BaseModel):
-    id: str
-    status: str
-    error: bool
-    output: Optional[str]
 
+@app.on_event("startup")
+async def startup():
+    # Async jobs (run, chat, summary) are scheduled onto the server's loop.
+    _scheduler.loop = asyncio.get_running_loop()
 
-_future_job = Job(id="future", status="running", error=False, output=None)
+    warm_up(lambda name: _emitter.broadcast(EventEmitter.format_sse(name, "ready")))
 
 
-def job(
-    _func=None, notebook_id: str = None, job_id: str = None, requires_lock: bool = False
-):
-    @functools.wraps(_func)
-    def wrapper(*args, **kwargs):
-        with _jobs_lock:
-            _jobs[notebook_id][job_id] = Job(
-                id=job_id, status="running", error=False, output=None
-            )
-
-        if requires_lock:
-            _notebooks_lock.acquire()
-
-        error = False
-        # try:
-        output = _func(*args, **kwargs)
-        # except Exception as e:
-        #    error = True
-        #    output = None
-
-        if requires_lock:
-            _notebooks_lock.release()
-
-        with _jobs_lock:
-            _jobs[notebook_id][job_id].status = "finished"
-            _jobs[notebook_id][job_id].error = error
-            _jobs[notebook_id][job_id].output = output
-
-    if notebook_id not in _jobs:
-        with _jobs_lock:
-            _jobs[notebook_id] = OrderedDict()
-
-    if _func is None:
-        return lambda _func: job(
-            _func, notebook_id=notebook_id, job_id=job_id, requires_lock=requires_lock
-        )
+@app.on_event("shutdown")
+def shutdown():
+    # Flushes what the autosave hasn't written yet.
+    with _notebooks_lock:
+        notebooks = list(_notebooks.values())
+
+    for notebook in notebooks:
+        notebook.close()
 
-    return threading.Thread(target=wrapper)
 
+# Routes that only submit jobs or read scheduler state are async. Routes that
+# read notebook state take its locks, so they are plain functions and run in
+# the threadpool instead of blocking the loop.
 
-@app.route("/ping/<notebook_id>")
-def ping(notebook_id):
+
+@app.get("/ping/{notebook_id}")
+async def ping(notebook_id: str):
     _emitter.emit(notebook_id, EventEmitter.format_sse("ping", "ping"))
 
-    return jsonify("pong")
+    return "pong"
 
 
-@app.route("/files/open")
-def open_file():
-    job_id = uuid()
-    notebook_id = request.args.get("notebook_id")
-    type = request.args.get("type")
+@app.get("/ready")
+async def get_readiness():
+    return readiness()
+
+
+@app.get("/embeddings/cache")
+def get_embedding_cache_stats():
+    return embedding_cache_stats()
+
 
-    @job(notebook_id=notebook_id, job_id=job_id)
-    def _thread():
+@app.get("/llm")
+def get_llm_stats():
+    return llm_stats()
+
+
+@app.get("/llm/cache")
+def get_completion_cache_stats():
+    return completion_cache_stats()
+
+
+@app.get("/files/open")
+async def open_file(notebook_id: str, type: Optional[str] = None):
+    def _job():
         return (
             filedialog.askopenfilename()
             if type == "file"
             else filedialog.askdirectory()
         )
 
-    _thread.start()
-
-    return jsonify(job_id)
+    job_id = _scheduler.submit(notebook_id, "dialog", _job)
 
+    return job_id
 
-@app.route("/files/save", methods=["POST"])
-def save_file():
-    job_id = uuid()
-    notebook_id = request.args.get("notebook_id")
-    type = request.args.get("type")
 
-    @job(notebook_id=notebook_id, job_id=job_id)
-    def _thread():
+@app.post("/files/save")
+async def save_file(notebook_id: str, type: Optional[str] = None):
+    def _job():
         return (
             filedialog.asksaveasfilename()
             if type == "file"
             else filedialog.askdirectory()
         )
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "dialog", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/create")
-def create_notebook():
+@app.get("/notebooks/create")
+def create_notebook(name: Optional[str] = None, path: Optional[str] = None):
     notebook_id = uuid()
-    name = request.args.get("name")
-    path = request.args.get("path")
 
     with _notebooks_lock:
-        _notebooks[notebook_id] = Notebook(name, path)
+        _notebooks[notebook_id] = Notebook(name, path, id=notebook_id, emitter=_emitter)
+
+    return notebook_id
 
-    return jsonify(notebook_id)
 
+@app.get("/notebooks/load")
+async def load_notebook(path: Optional[str] = None):
+    job_id = uuid()
 
-@app.route("/notebooks/<notebook_id>/rename")
-def rename_notebook(notebook_id):
-    name = request.args.get("name")
+    def _job():
+        notebook = Notebook.load(path, id=job_id, emitter=_emitter)
 
+        with _notebooks_lock:
+            _notebooks[job_id] = notebook
+
+        return job_id
+
+    _scheduler.submit(job_id, "load", _job, job_id=job_id)
+
+    return job_id
+
+
+@app.get("/notebooks/{notebook_id}/rename")
+def rename_notebook(notebook_id: str, name: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        notebook.rename(name)
 
-    return jsonify(notebook.to_dict())
+    notebook.rename(name)
+
+    return notebook.to_dict()
 
 
-@app.route("/notebooks/<notebook_id>")
-def get_notebook(notebook_id):
+@app.get("/notebooks/{notebook_id}")
+def get_notebook(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
 
-    return jsonify(notebook.to_dict())
+    return notebook.to_dict()
 
 
-@app.route("/notebooks/<notebook_id>/name")
-def get_name(notebook_id):
+@app.get("/notebooks/{notebook_id}/search/cache")
+def get_search_cache_stats(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        name = notebook.name
 
-    return jsonify(name)
+    return notebook.search_cache_stats()
 
 
-@app.route("/notebooks/<notebook_id>/content")
-def get_content(notebook_id):
+@app.get("/notebooks/{notebook_id}/name")
+def get_name(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        content = notebook.content
 
-    return jsonify(content)
+    name = notebook.name
 
+    return name
 
-@app.route("/notebooks/<notebook_id>/save", methods=["POST"])
-def save_notebook(notebook_id):
-    job_id = uuid()
-    path = request.args.get("path")
-    content = request.get_json()
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
+@app.get("/notebooks/{notebook_id}/content")
+def get_content(notebook_id: str):
+    with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        notebook.save(content, path=path)
 
-    _thread.start()
+    content = notebook.content
 
-    return jsonify(job_id)
+    return content
 
 
-@app.route("/notebooks/load")
-def load_notebook():
-    job_id = uuid()
-    path = request.args.get("path")
+@app.post("/notebooks/{notebook_id}/save")
+async def save_notebook(
+    notebook_id: str, path: Optional[str] = None, content: Any = Body(None)
+):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=job_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        _notebooks[job_id] = Notebook.load(path)
-        return job_id
+        notebook.save(content, path=path)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "save", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/run", methods=["POST"])
-def notebook_run(notebook_id):
-    job_id = uuid()
-    prompt = request.args.get("prompt")
-    content = request.get_json()
+@app.post("/notebooks/{notebook_id}/run")
+async def notebook_run(
+    notebook_id: str, prompt: Optional[str] = None, content: Any = Body(None)
+):
+    async def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
-        return notebook.run(prompt, content=content)
+        return await notebook.arun(prompt, content=content)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "run", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/generate", methods=["POST"])
-def notebook_generate(notebook_id):
-    job_id = uuid()
-    prompt = request.args.get("prompt")
-    content = request.get_json()
+@app.post("/notebooks/{notebook_id}/generate")
+async def notebook_generate(
+    notebook_id: str, prompt: Optional[str] = None, content: Any = Body(None)
+):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
         return notebook.generate(prompt, content=content)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "generate", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/edit", methods=["POST"])
-def notebook_edit(notebook_id):
-    job_id = uuid()
-    prompt = request.args.get("prompt")
-    text = request.args.get("text")
-    content = request.get_json()
+@app.post("/notebooks/{notebook_id}/edit")
+async def notebook_edit(
+    notebook_id: str,
+    prompt: Optional[str] = None,
+    text: Optional[str] = None,
+    content: Any = Body(None),
+):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
         return notebook.edit(prompt, text, content=content)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "edit", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/chat")
-def notebook_chat(notebook_id):
-    job_id = uuid()
-    prompt = request.args.get("prompt")
+@app.get("/notebooks/{notebook_id}/chat")
+async def notebook_chat(notebook_id: str, prompt: Optional[str] = None):
+    async def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
-        return notebook.chat(prompt)
+        return await notebook.achat(prompt)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "chat", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/ideas", methods=["POST"])
-def get_ideas(notebook_id):
-    job_id = uuid()
-    content = request.get_json()
+@app.post("/notebooks/{notebook_id}/ideas")
+async def get_ideas(notebook_id: str, content: Any = Body(None)):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
         return notebook.ideas(content=content)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "ideas", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/sources")
-def get_sources(notebook_id):
+@app.get("/notebooks/{notebook_id}/sources")
+def get_sources(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        sources = notebook.sources_to_dict()
 
-    return jsonify(sources)
+    sources = notebook.sources_to_dict()
 
+    return sources
 
-@app.route("/notebooks/<notebook_id>/sources/add")
-def add_source(notebook_id):
-    job_id = uuid()
-    type = request.args.get("type")
-    origin = request.args.get("origin")
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
+@app.get("/notebooks/{notebook_id}/sources/add")
+async def add_source(notebook_id: str, type: str, origin: str):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
+
         return notebook.add_source(type, origin)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "ingest", _job)
+
+    return job_id
 
-    return jsonify(job_id)
 
+@app.post("/notebooks/{notebook_id}/sources/bulk")
+async def add_sources(notebook_id: str, items: List[Dict[str, str]] = Body(...)):
+    def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-@app.route("/notebooks/<notebook_id>/sources/<source_id>")
-def get_source(notebook_id, source_id):
+        return notebook.add_sources(items)
+
+    job_id = _scheduler.submit(notebook_id, "bulk", _job)
+
+    return job_id
+
+
+@app.get("/notebooks/{notebook_id}/sources/{source_id}")
+def get_source(notebook_id: str, source_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        source = notebook.get_source(source_id).dict()
 
-    return jsonify(source)
+    source = notebook.get_source(source_id).dict()
+
+    return source
 
 
-@app.route("/notebooks/<notebook_id>/sources/<source_id>/content")
-def get_source_content(notebook_id, source_id):
+@app.get("/notebooks/{notebook_id}/sources/{source_id}/content")
+def get_source_content(notebook_id: str, source_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        content = notebook.get_content(source_id)
 
-    return jsonify(content)
+    content = notebook.get_content(source_id)
 
+    return content
 
-@app.route("/notebooks/<notebook_id>/sources/<source_id>/summary")
-def get_source_summary(notebook_id, source_id):
-    job_id = uuid()
-    last_k = request.args.get("last_k")
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
-        return notebook.summary(source_id, last_k=last_k, live=True)
+@app.get("/notebooks/{notebook_id}/sources/{source_id}/summary")
+async def get_source_summary(
+    notebook_id: str, source_id: str, last_k: Optional[int] = None
+):
+    async def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
+
+        return await notebook.asummary(source_id, last_k=last_k)
 
-    _thread.start()
+    job_id = _scheduler.submit(notebook_id, "summary", _job)
 
-    return jsonify(job_id)
+    return job_id
 
 
-@app.route("/notebooks/<notebook_id>/live_sources")
-def get_live_sources(notebook_id):
+@app.get("/notebooks/{notebook_id}/live_sources")
+def get_live_sources(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        live_sources = notebook.live_sources_to_dict()
 
-    return jsonify(live_sources)
+    live_sources = notebook.live_sources_to_dict()
 
+    return live_sources
 
-# TODO: add error handling
-@app.route("/notebooks/<notebook_id>/live_sources/start")
-def start_live_source(notebook_id):
-    type = request.args.get("type")
-    origin = request.args.get("origin")
 
+# TODO: add error handling
+@app.get("/notebooks/{notebook_id}/live_sources/start")
+def start_live_source(
+    notebook_id: str,
+    type: str,
+    origin: str,
+    streaming: bool = False,
+    vad: bool = True,
+):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        id = notebook.start_live_source(type, origin)
 
-    return jsonify(id)
+    id = notebook.start_live_source(type, origin, streaming=streaming, vad=vad)
 
+    return id
 
-@app.route("/notebooks/<notebook_id>/live_sources/running")
-def get_running_live_sources(notebook_id):
+
+@app.get("/notebooks/{notebook_id}/live_sources/running")
+def get_running_live_sources(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        live_sources = notebook.running_live_sources
 
-    return jsonify(live_sources)
+    live_sources = notebook.running_live_sources
+
+    return live_sources
 
 
 # TODO: add error handling
-@app.route("/notebooks/<notebook_id>/live_sources/<source_id>")
-def get_live_source(notebook_id, source_id):
+@app.get("/notebooks/{notebook_id}/live_sources/{source_id}")
+def get_live_source(notebook_id: str, source_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        live_source = notebook.get_live_source(source_id).dict()
 
-    return jsonify(live_source)
+    live_source = notebook.get_live_source(source_id).dict()
 
+    return live_source
 
-@app.route("/notebooks/<notebook_id>/live_sources/<source_id>/summary")
-def get_live_source_summary(notebook_id, source_id):
-    job_id = uuid()
-    last_k = request.args.get("last_k")
 
-    @job(notebook_id=notebook_id, job_id=job_id, requires_lock=True)
-    def _thread():
-        notebook = _notebooks[notebook_id]
-        return notebook.summary(source_id, last_k=last_k, live=True)
+@app.get("/notebooks/{notebook_id}/live_sources/{source_id}/summary")
+async def get_live_source_summary(
+    notebook_id: str, source_id: str, last_k: Optional[int] = None
+):
+    async def _job():
+        with _notebooks_lock:
+            notebook = _notebooks[notebook_id]
 
-    _thread.start()
+        return await notebook.asummary(source_id, last_k=last_k, live=True)
 
-    return jsonify(job_id)
+    job_id = _scheduler.submit(notebook_id, "summary", _job)
+
+    return job_id
 
 
 # TODO: add error handling
-@app.route("/notebooks/<notebook_id>/live_sources/<source_id>/stop")
-def stop_live_source(notebook_id, source_id):
+@app.get("/notebooks/{notebook_id}/live_sources/{source_id}/stop")
+def stop_live_source(notebook_id: str, source_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        notebook.stop_live_source(source_id)
 
-    return jsonify(True)
+    notebook.stop_live_source(source_id)
+
+    return True
 
 
-@app.route("/notebooks/<notebook_id>/documents/<document_id>")
-def get_document(notebook_id, document_id):
+@app.get("/notebooks/{notebook_id}/documents/{document_id}")
+def get_document(notebook_id: str, document_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        document = notebook.get_doc(document_id).dict()
 
-    return jsonify(document)
+    document = notebook.get_doc(document_id).dict()
 
+    return document
 
-@app.route("/notebooks/<notebook_id>/conversation")
-def get_conversation(notebook_id):
+
+@app.get("/notebooks/{notebook_id}/conversation")
+def get_conversation(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        conversation = notebook.conversation_to_dict()
 
-    return jsonify(conversation)
+    conversation = notebook.conversation_to_dict()
+
+    return conversation
 
 
-@app.route("/notebooks/<notebook_id>/generations")
-def get_generations(notebook_id):
+@app.get("/notebooks/{notebook_id}/generations")
+def get_generations(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        generations = notebook.generations_to_dict()
 
-    return jsonify(generations)
+    generations = notebook.generations_to_dict()
+
+    return generations
+
+
+@app.get("/notebooks/{notebook_id}/jobs")
+async def get_jobs(notebook_id: str):
+    jobs = [job.dict() for job in _scheduler.jobs(notebook_id)]
+
+    return jobs
+
+
+@app.get("/notebooks/{notebook_id}/jobs/{job_id}")
+async def get_job(notebook_id: str, job_id: str):
+    job = _scheduler.get(notebook_id, job_id)
+
+    if job is None:
+        return JSONResponse(f"Unknown job {job_id}", status_code=404)
 
+    return job.dict()
 
-@app.route("/notebooks/<notebook_id>/jobs")
-def get_jobs(notebook_id):
-    with _jobs_lock:
-        if notebook_id not in _jobs:
-            _jobs[notebook_id] = OrderedDict()
 
-        jobs = _jobs[notebook_id]
-        jobs = [job.dict() for job in jobs.values()]
+@app.get("/notebooks/{notebook_id}/jobs/{job_id}/wait")
+async def wait_job(notebook_id: str, job_id: str, timeout: float = 30):
+    job = await _scheduler.wait_async(notebook_id, job_id, timeout=timeout)
 
-    return jsonify(jobs)
+    if job is None:
+        return JSONResponse(f"Unknown job {job_id}", status_code=404)
 
+    return job.dict()
 
-@app.route("/notebooks/<notebook_id>/jobs/<job_id>")
-def get_job(notebook_id, job_id):
-    with _jobs_lock:
-        if job_id not in _jobs[notebook_id]:
-            return jsonify(_future_job.dict())
 
-        job = _jobs[notebook_id][job_id]
-        job = job.dict()
+@app.get("/notebooks/{notebook_id}/jobs/{job_id}/cancel")
+async def cancel_job(notebook_id: str, job_id: str):
+    cancelled = _scheduler.cancel(notebook_id, job_id)
 
-    return jsonify(job)
+    return cancelled
 
 
-@app.route("/notebooks/<notebook_id>/pca")
-def get_pca(notebook_id):
+@app.get("/notebooks/{notebook_id}/pca")
+def get_pca(notebook_id: str):
     with _notebooks_lock:
         notebook = _notebooks[notebook_id]
-        pca = notebook.pca()
 
-    return jsonify(pca)
+    pca = notebook.pca()
 
+    return pca
 
-@app.route("/events/<notebook_id>")
-def get_events(notebook_id):
-    def _stream():
-        messages = _emitter.listen(notebook_id)
-        while True:
-            message = messages.get()
-            yield message
 
-    return Response(_stream(), mimetype="text/event-stream")
+@app.get("/events/{notebook_id}")
+async def get_events(notebook_id: str, last_event_id: Optional[str] = Header(None)):
+    # EventSource sends Last-Event-ID when it reconnects, so missed events are
+    # replayed from the emitter's history.
+    return StreamingResponse(
+        _emitter.stream(notebook_id, last_event_id),
+        media_type="text/event-stream",
+    )
 
 
 if __name__ == "__main__":
-    app.run(threaded=True)
+    uvicorn.run(app, host="127.0.0.1", port=5000)
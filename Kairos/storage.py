@@ -0,0 +1,476 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import faiss
+import numpy
+
+from pathlib import Path
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.docstore.document import Document
+from langchain.vectorstores import FAISS
+from pydantic import BaseModel
+
+from Kairos.indexes import read_index, is_read_only
+
+
+_VERSION = 1
+
+_STORE_FILE = "notebook.sqlite"
+
+_INDEX_FILE = "index.faiss"
+
+# Vectors are folded into the index snapshot once the delta reaches this many
+# rows, or half the snapshot, whichever is larger, so compaction stays
+# amortized O(changes).
+_compact_min_rows = 1024
+
+_compact_ratio = 0.5
+
+
+class StoreDocstore(Docstore, AddableMixin):
+    # Reads chunks from the store on demand. Chunks added since the last save
+    # are held in memory until the store has them.
+    _store: "NotebookStore"
+    _pending: Dict[str, Document]
+
+    def __init__(self, store: "NotebookStore"):
+        self._store = store
+        self._pending = {}
+
+    def search(self, search: str) -> Union[str, Document]:
+        doc = self._pending.get(search)
+        if doc is None:
+            doc = self._store.get_document(search)
+        if doc is None:
+            return f"ID {search} not found."
+        return doc
+
+    def add(self, texts: Dict[str, Document]):
+        self._pending.update(texts)
+
+    def forget(self, ids: List[str]):
+        for id in ids:
+            self._pending.pop(id, None)
+
+
+class StoreRowIds(MutableMapping):
+    # FAISS row -> docstore id, read from the store on demand. Rows are
+    # contiguous, so rows past the store's are the ones added since the last
+    # save.
+    _store: "NotebookStore"
+    _pending: Dict[int, str]
+    _len: int
+
+    def __init__(self, store: "NotebookStore"):
+        self._store = store
+        self._pending = {}
+        self._len = store.rows
+
+    def __getitem__(self, row: int) -> str:
+        id = self._pending.get(row)
+        if id is None:
+            id = self._store.get_doc_id(int(row))
+        if id is None:
+            raise KeyError(row)
+        return id
+
+    def __setitem__(self, row: int, id: str):
+        self._pending[int(row)] = id
+        self._len = max(self._len, int(row) + 1)
+
+    def __delitem__(self, row: int):
+        raise NotImplementedError("Index rows can't be removed")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def forget(self, rows: List[int]):
+        for row in rows:
+            self._pending.pop(row, None)
+
+
+class NotebookStore:
+    path: str
+
+    _connection: sqlite3.Connection
+    _lock: threading.Lock
+    _messages: int
+    _generations: int
+    _rows: int
+    _snapshot_rows: int
+    _source_ids: Dict[str, int]
+    _docstore: Optional[StoreDocstore]
+    _row_ids: Optional[StoreRowIds]
+
+    def __init__(self, path: str):
+        logging.debug(f"Opening notebook store: {path=}")
+
+        Path(path).mkdir(parents=True, exist_ok=True)
+
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(Path(path) / _STORE_FILE), check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Every table is append-only apart from meta (name, content, snapshot
+        # bookkeeping) and the sources of a failed ingestion, so a save only
+        # writes what changed since the last one.
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS sources ("
+            "position INTEGER PRIMARY KEY, id TEXT UNIQUE, live INTEGER, "
+            "type TEXT, origin TEXT);"
+            "CREATE TABLE IF NOT EXISTS source_ids ("
+            "source_id TEXT, position INTEGER, doc_id TEXT, "
+            "PRIMARY KEY (source_id, position));"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "position INTEGER PRIMARY KEY, data TEXT);"
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "position INTEGER PRIMARY KEY, data TEXT);"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "row INTEGER PRIMARY KEY, doc_id TEXT, page_content TEXT, "
+            "metadata TEXT, vector BLOB);"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS documents_doc_id ON documents (doc_id)"
+        )
+        self._connection.execute(
+            "INSERT OR IGNORE INTO meta VALUES ('version', ?)", (str(_VERSION),)
+        )
+        self._connection.commit()
+
+        self._messages = self._count("messages")
+        self._generations = self._count("generations")
+        self._rows = self._count("documents")
+        self._snapshot_rows = int(self._meta("snapshot_rows", "0"))
+        self._source_ids = dict(
+            self._connection.execute(
+                "SELECT sources.id, COUNT(source_ids.doc_id) FROM sources "
+                "LEFT JOIN source_ids ON source_ids.source_id = sources.id "
+                "GROUP BY sources.id"
+            ).fetchall()
+        )
+
+        self._docstore = None
+        self._row_ids = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return (Path(path) / _STORE_FILE).exists()
+
+    @property
+    def messages(self) -> int:
+        return self._messages
+
+    @property
+    def generations(self) -> int:
+        return self._generations
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def _count(self, table: str) -> int:
+        return self._connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def _meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row is not None else default
+
+    def get_document(self, doc_id: str) -> Optional[Document]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_content, metadata FROM documents WHERE doc_id = ?",
+                (doc_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def get_doc_id(self, row: int) -> Optional[str]:
+        with self._lock:
+            found = self._connection.execute(
+                "SELECT doc_id FROM documents WHERE row = ?", (row,)
+            ).fetchone()
+
+        return found[0] if found is not None else None
+
+    def get_row(self, doc_id: str) -> Optional[int]:
+        with self._lock:
+            found = self._connection.execute(
+                "SELECT row FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+
+        return found[0] if found is not None else None
+
+    def load(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = {"sources": [], "live_sources": []}
+            for id, live, type, origin in self._connection.execute(
+                "SELECT id, live, type, origin FROM sources ORDER BY position"
+            ):
+                ids = [
+                    doc_id
+                    for doc_id, in self._connection.execute(
+                        "SELECT doc_id FROM source_ids WHERE source_id = ? "
+                        "ORDER BY position",
+                        (id,),
+                    )
+                ]
+                sources["live_sources" if live else "sources"].append(
+                    {"id": id, "type": type, "origin": origin, "ids": ids}
+                )
+
+            return {
+                "name": json.loads(self._meta("name", "null")),
+                "content": json.loads(self._meta("content", "null")),
+                "embeddings_model": self._meta("embeddings_model"),
+                "conversation": [
+                    json.loads(data)
+                    for data, in self._connection.execute(
+                        "SELECT data FROM messages ORDER BY position"
+                    )
+                ],
+                "generations": [
+                    json.loads(data)
+                    for data, in self._connection.execute(
+                        "SELECT data FROM generations ORDER BY position"
+                    )
+                ],
+                **sources,
+            }
+
+    def read_snapshot(self, mmap: bool = False) -> Optional[faiss.Index]:
+        index_path = Path(self.path) / _INDEX_FILE
+        if not index_path.exists():
+            return None
+
+        return read_index(str(index_path), mmap=mmap)
+
+    def load_index(self, embedding_function: Callable) -> Optional[FAISS]:
+        # Only the vectors are read up front: the snapshot is memory-mapped
+        # where faiss supports it, and chunk texts stay on disk until a search
+        # touches them.
+        with self._lock:
+            if not self._rows:
+                return None
+
+            index = self.read_snapshot(mmap=True)
+
+            # The snapshot may be newer than snapshot_rows if a compaction was
+            # interrupted; its vectors are still in the delta until then.
+            base = index.ntotal if index is not None else 0
+            if base > self._rows:
+                raise ValueError(f"Index snapshot has more rows than {_STORE_FILE}")
+
+            # A mapped index is read-only, so it's read into memory when the
+            # delta has to be added to it.
+            if base < self._rows and is_read_only(index):
+                index = self.read_snapshot()
+
+            vectors = []
+            for row, vector in self._connection.execute(
+                "SELECT row, vector FROM documents WHERE row >= ? ORDER BY row",
+                (base,),
+            ):
+                if vector is None:
+                    raise ValueError(f"Missing vector for row {row}")
+                vectors.append(numpy.frombuffer(vector, dtype=numpy.float32))
+
+            if vectors:
+                matrix = numpy.stack(vectors)
+                if index is None:
+                    index = faiss.IndexFlatL2(matrix.shape[1])
+                index.add(matrix)
+
+        logging.debug(f"Loaded index: {base=}, {len(vectors)=}")
+
+        self._docstore = StoreDocstore(self)
+        self._row_ids = StoreRowIds(self)
+
+        return FAISS(embedding_function, index, self._docstore, self._row_ids)
+
+    def index_delta(
+        self, vectorstore: Optional[FAISS]
+    ) -> List[Tuple[int, str, Document, numpy.ndarray]]:
+        # Rows added since the last save. The caller holds the index lock.
+        if vectorstore is None or vectorstore.index.ntotal <= self._rows:
+            return []
+
+        start = self._rows
+        count = vectorstore.index.ntotal - start
+        vectors = vectorstore.index.reconstruct_n(start, count)
+
+        delta = []
+        for offset, vector in enumerate(vectors):
+            row = start + offset
+            doc_id = vectorstore.index_to_docstore_id[row]
+            delta.append((row, doc_id, vectorstore.docstore.search(doc_id), vector))
+
+        return delta
+
+    def sources_delta(
+        self, sources: List[BaseModel], live_sources: List[BaseModel]
+    ) -> Tuple[List[Tuple], List[Tuple]]:
+        # Sources and source ids added since the last save. The caller holds
+        # the index lock.
+        source_rows = []
+        id_rows = []
+        for live, source in [(False, source) for source in sources] + [
+            (True, source) for source in live_sources
+        ]:
+            saved = self._source_ids.get(source.id)
+            if saved is None:
+                source_rows.append((source.id, live, source.type, source.origin))
+                saved = 0
+
+            id_rows.extend(
+                (source.id, saved + i, doc_id)
+                for i, doc_id in enumerate(source.ids[saved:])
+            )
+
+        return source_rows, id_rows
+
+    def append(
+        self,
+        name: str,
+        content: Any,
+        embeddings_model: str,
+        source_rows: List[Tuple],
+        id_rows: List[Tuple],
+        messages: List[BaseModel],
+        generations: List[BaseModel],
+        delta: List[Tuple[int, str, Document, numpy.ndarray]],
+    ):
+        logging.debug(
+            f"Appending to notebook store: {len(messages)=}, {len(generations)=}, "
+            f"{len(source_rows)=}, {len(id_rows)=}, {len(delta)=}"
+        )
+
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                    [
+                        ("name", json.dumps(name)),
+                        ("content", json.dumps(content)),
+                        ("embeddings_model", embeddings_model),
+                    ],
+                )
+                self._connection.executemany(
+                    "INSERT INTO sources (id, live, type, origin) VALUES (?, ?, ?, ?)",
+                    source_rows,
+                )
+                self._connection.executemany(
+                    "INSERT INTO source_ids VALUES (?, ?, ?)", id_rows
+                )
+                self._connection.executemany(
+                    "INSERT INTO messages VALUES (?, ?)",
+                    [
+                        (self._messages + i, message.json())
+                        for i, message in enumerate(messages)
+                    ],
+                )
+                self._connection.executemany(
+                    "INSERT INTO generations VALUES (?, ?)",
+                    [
+                        (self._generations + i, generation.json())
+                        for i, generation in enumerate(generations)
+                    ],
+                )
+                self._insert_documents(delta)
+
+            self._forget(delta)
+
+            self._messages += len(messages)
+            self._generations += len(generations)
+            for id, *_ in source_rows:
+                self._source_ids[id] = 0
+            for id, *_ in id_rows:
+                self._source_ids[id] += 1
+
+    def remove_source(self, id: str):
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM source_ids WHERE source_id = ?", (id,)
+                )
+                self._connection.execute("DELETE FROM sources WHERE id = ?", (id,))
+
+            self._source_ids.pop(id, None)
+
+    def _insert_documents(self, delta: List[Tuple[int, str, Document, numpy.ndarray]]):
+        self._connection.executemany(
+            "INSERT INTO documents VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    row,
+                    doc_id,
+                    doc.page_content,
+                    json.dumps(doc.metadata, default=str),
+                    numpy.asarray(vector, dtype=numpy.float32).tobytes(),
+                )
+                for row, doc_id, doc, vector in delta
+            ],
+        )
+        self._rows += len(delta)
+
+    def _forget(self, delta: List[Tuple[int, str, Document, numpy.ndarray]]):
+        # Saved chunks are dropped from memory and read back from the store.
+        if self._docstore is not None:
+            self._docstore.forget([doc_id for _, doc_id, _, _ in delta])
+        if self._row_ids is not None:
+            self._row_ids.forget([row for row, _, _, _ in delta])
+
+    def should_compact(self) -> bool:
+        delta = self._rows - self._snapshot_rows
+        return delta >= max(_compact_min_rows, _compact_ratio * self._snapshot_rows)
+
+    def compact(self, vectorstore: FAISS):
+        # Writes a snapshot of the index so the delta vectors can be dropped.
+        # The caller holds the index lock.
+        delta = self.index_delta(vectorstore)
+        if delta:
+            with self._lock:
+                with self._connection:
+                    self._insert_documents(delta)
+
+                self._forget(delta)
+
+        rows = vectorstore.index.ntotal
+
+        logging.debug(f"Compacting notebook store: {self._snapshot_rows=}, {rows=}")
+
+        index_path = Path(self.path) / _INDEX_FILE
+        tmp_path = index_path.with_suffix(".tmp")
+        faiss.write_index(vectorstore.index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('snapshot_rows', ?)",
+                    (str(rows),),
+                )
+                self._connection.execute(
+                    "UPDATE documents SET vector = NULL WHERE row < ?", (rows,)
+                )
+
+            self._snapshot_rows = rows
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
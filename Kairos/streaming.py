@@ -0,0 +1,87 @@
+import logging
+import contextlib
+import contextvars
+
+from typing import Any, Callable, Dict, List, Optional, Union
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import AgentAction, AgentFinish, LLMResult
+
+
+_target: contextvars.ContextVar[Optional[Callable[[str, Dict], None]]] = (
+    contextvars.ContextVar("target", default=None)
+)
+
+
+@contextlib.contextmanager
+def stream_to(emit: Callable[[str, Dict], None]):
+    # Callbacks fire in the thread or asyncio task that runs the LLM or
+    # agent, so a context variable routes them to the generation in progress
+    # without giving every notebook its own LLM.
+    token = _target.set(emit)
+    try:
+        yield
+    finally:
+        _target.reset(token)
+
+
+def emit(event: str, data: Dict):
+    target = _target.get()
+    if target is None:
+        return
+
+    try:
+        target(event, data)
+    except Exception:
+        logging.exception(f"Failed to stream {event}")
+
+
+class StreamingHandler(BaseCallbackHandler):
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    ):
+        pass
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        emit("token", {"token": token})
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any):
+        pass
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any):
+        pass
+
+    def on_chain_start(
+        self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any
+    ):
+        pass
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any):
+        pass
+
+    def on_chain_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any):
+        pass
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any):
+        pass
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any):
+        emit(
+            "action",
+            {"tool": action.tool, "tool_input": action.tool_input, "log": action.log},
+        )
+
+    def on_tool_end(self, output: str, **kwargs: Any):
+        emit("observation", {"output": output})
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any):
+        pass
+
+    def on_text(self, text: str, **kwargs: Any):
+        pass
+
+    def on_agent_finish(self, finish: AgentFinish, **kwargs: Any):
+        emit("finish", {"output": finish.return_values.get("output")})
@@ -0,0 +1,135 @@
+import logging
+import numpy
+import torch
+
+from typing import Dict, List, Optional, Type
+from transformers import WhisperProcessor, WhisperForConditionalGeneration
+
+
+_SAMPLE_RATE = 16000
+
+_SIZES = ["tiny", "base", "small", "medium", "large"]
+
+
+class Transcriber:
+    size: str
+    num_threads: Optional[int]
+
+    def __init__(self, size: str = "medium", num_threads: Optional[int] = None):
+        if size not in _SIZES:
+            raise ValueError(f"Unknown transcriber size {size}")
+
+        self.size = size
+        self.num_threads = num_threads
+
+    def transcribe(self, audios: List[numpy.ndarray]) -> List[str]:
+        raise NotImplementedError
+
+
+class WhisperTranscriber(Transcriber):
+    quantize: bool
+
+    _processor: WhisperProcessor
+    _model: WhisperForConditionalGeneration
+
+    def __init__(
+        self,
+        size: str = "medium",
+        num_threads: Optional[int] = None,
+        quantize: bool = False,
+    ):
+        super().__init__(size, num_threads)
+
+        self.quantize = quantize
+
+        model = f"openai/whisper-{size}"
+
+        logging.debug(f"Loading whisper transcriber: {model=}, {quantize=}")
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self._processor = WhisperProcessor.from_pretrained(model)
+        self._model = WhisperForConditionalGeneration.from_pretrained(model)
+        self._model.config.forced_decoder_ids = None
+        self._model.eval()
+
+        if quantize:
+            self._model = torch.quantization.quantize_dynamic(
+                self._model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+    def transcribe(self, audios: List[numpy.ndarray]) -> List[str]:
+        input_features = self._processor(
+            audio=audios,
+            sampling_rate=_SAMPLE_RATE,
+            return_tensors="pt",
+        ).input_features
+
+        with torch.inference_mode():
+            predicted_ids = self._model.generate(input_features)
+
+        return self._processor.batch_decode(predicted_ids, skip_special_tokens=True)
+
+
+class CTranslate2Transcriber(Transcriber):
+    quantize: bool
+
+    _model: "faster_whisper.WhisperModel"
+
+    def __init__(
+        self,
+        size: str = "medium",
+        num_threads: Optional[int] = None,
+        quantize: bool = True,
+    ):
+        super().__init__(size, num_threads)
+
+        try:
+            import faster_whisper
+        except ImportError:
+            raise ImportError(
+                "The ctranslate2 transcriber backend requires faster-whisper, "
+                "install it with `pip install faster-whisper`"
+            )
+
+        self.quantize = quantize
+
+        logging.debug(f"Loading ctranslate2 transcriber: {size=}, {quantize=}")
+
+        self._model = faster_whisper.WhisperModel(
+            size,
+            device="cpu",
+            compute_type="int8" if quantize else "float32",
+            cpu_threads=num_threads or 0,
+        )
+
+    def transcribe(self, audios: List[numpy.ndarray]) -> List[str]:
+        transcriptions = []
+        for audio in audios:
+            segments, _ = self._model.transcribe(audio.astype(numpy.float32))
+            transcriptions.append("".join(segment.text for segment in segments))
+
+        return transcriptions
+
+
+_BACKENDS: Dict[str, Type[Transcriber]] = {
+    "transformers": WhisperTranscriber,
+    "ctranslate2": CTranslate2Transcriber,
+}
+
+
+def load_transcriber(
+    backend: str = "transformers",
+    size: str = "medium",
+    num_threads: Optional[int] = None,
+    quantize: Optional[bool] = None,
+) -> Transcriber:
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown transcriber backend {backend}")
+
+    kwargs = {}
+    if quantize is not None:
+        kwargs["quantize"] = quantize
+
+    return _BACKENDS[backend](size=size, num_threads=num_threads, **kwargs)
@@ -1,19 +1,204 @@
 import queue
+import asyncio
+import threading
+import itertools
+import contextlib
+import collections
 
-from typing import Dict, List, Optional
+from typing import (
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 from uuid import uuid4
 
 
+T = TypeVar("T")
+
+
 def uuid() -> str:
     return str(uuid4())
 
 
-class EventEmitter:
-    qs: Dict[str, List[queue.Queue]]
+class Lazy(Generic[T]):
+    name: str
+
+    _factory: Callable[[], T]
+    _value: Optional[T]
+    _lock: threading.Lock
+    _ready: threading.Event
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def get(self) -> T:
+        if not self._ready.is_set():
+            with self._lock:
+                if not self._ready.is_set():
+                    self._value = self._factory()
+                    self._ready.set()
+
+        return self._value
+
+
+class RWLock:
+    _cond: threading.Condition
+    _readers: int
+    _writer: bool
+    _waiting_writers: int
 
     def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        with self._cond:
+            # Waiting writers go first so a steady stream of readers can't
+            # starve them.
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _Listener:
+    max_size: int
+    dropped: int
+
+    _buffer: Deque[Tuple[Optional[str], str]]
+    _cond: threading.Condition
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.dropped = 0
+
+        self._buffer = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, message: str, key: Optional[str] = None):
+        with self._cond:
+            # A keyed message supersedes the pending one with the same key
+            # (e.g. progress updates), so slow readers only see the latest.
+            if key is not None:
+                for i, (pending, _) in enumerate(self._buffer):
+                    if pending == key:
+                        del self._buffer[i]
+                        break
+
+            if len(self._buffer) >= self.max_size:
+                self._buffer.popleft()
+                self.dropped += 1
+
+            self._buffer.append((key, message))
+            self._cond.notify()
+
+        self._wake()
+
+    def _wake(self):
+        pass
+
+    def _pop(self) -> Optional[str]:
+        with self._cond:
+            if not self._buffer:
+                return None
+            return self._buffer.popleft()[1]
+
+    def get(self, timeout: Optional[float] = None) -> str:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer, timeout):
+                raise queue.Empty
+            return self._buffer.popleft()[1]
+
+
+class _AsyncListener(_Listener):
+    _loop: asyncio.AbstractEventLoop
+    _event: asyncio.Event
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def _wake(self):
+        # Emitters run on worker threads; the event belongs to the loop.
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def get(self) -> str:
+        while True:
+            message = self._pop()
+            if message is not None:
+                return message
+
+            # A put after the pop above schedules set() after this clear().
+            self._event.clear()
+            await self._event.wait()
+
+
+class EventEmitter:
+    max_queue: int
+    max_history: int
+    max_ids: int
+    qs: Dict[str, List[_Listener]]
+
+    _history: "collections.OrderedDict[str, Deque[Tuple[int, Optional[str], str]]]"
+    _seq: Iterator[int]
+    _lock: threading.Lock
+
+    def __init__(
+        self, max_queue: int = 256, max_history: int = 256, max_ids: int = 256
+    ):
+        self.max_queue = max_queue
+        self.max_history = max_history
+        self.max_ids = max_ids
         self.qs = {}
 
+        self._history = collections.OrderedDict()
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
     @staticmethod
     def format_sse(data: str, event: Optional[str] = None) -> str:
         msg = f"data: {data}\n\n"
@@ -21,22 +206,76 @@ class EventEmitter:
             msg = f"event: {event}\n{msg}"
         return msg
 
-    def listen(self, id: str):
-        if id not in self.qs:
-            self.qs[id] = []
+    def _subscribe(self, id: str, q: _Listener, last_event_id: Optional[str]):
+        with self._lock:
+            # Replayed under the lock so nothing is missed or sent twice
+            # between the replay and the first live message.
+            if last_event_id is not None and last_event_id.isdigit():
+                for seq, key, message in self._history.get(id, ()):
+                    if seq > int(last_event_id):
+                        q.put(message, key)
+
+            self.qs.setdefault(id, []).append(q)
 
-        q = queue.Queue()
-        self.qs[id].append(q)
+    def listen(self, id: str, last_event_id: Optional[str] = None) -> _Listener:
+        q = _Listener(self.max_queue)
+        self._subscribe(id, q, last_event_id)
         return q
 
-    def emit(self, id: str, message: str):
-        if id not in self.qs:
-            return
+    def listen_async(
+        self, id: str, last_event_id: Optional[str] = None
+    ) -> _AsyncListener:
+        # Must be called from the event loop that will await the messages.
+        q = _AsyncListener(self.max_queue)
+        self._subscribe(id, q, last_event_id)
+        return q
+
+    def unlisten(self, id: str, q: _Listener):
+        with self._lock:
+            listeners = self.qs.get(id, [])
+            if q in listeners:
+                listeners.remove(q)
+            if not listeners:
+                self.qs.pop(id, None)
+
+    async def stream(
+        self, id: str, last_event_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        q = self.listen_async(id, last_event_id)
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            # Runs when the consumer closes the generator, e.g. on disconnect.
+            self.unlisten(id, q)
+
+    def broadcast(self, message: str, key: Optional[str] = None):
+        with self._lock:
+            ids = list(self.qs.keys())
+
+        for id in ids:
+            self.emit(id, message, key=key)
+
+    def emit(self, id: str, message: str, key: Optional[str] = None):
+        with self._lock:
+            seq = next(self._seq)
+            message = f"id: {seq}\n{message}"
 
-        listeners = self.qs[id]
+            history = self._history.get(id)
+            if history is None:
+                history = self._history[id] = collections.deque(maxlen=self.max_history)
+                # Any id can be emitted to, so the ids that have gone quiet the
+                # longest lose their replay buffers first.
+                while len(self._history) > self.max_ids:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(id)
+            history.append((seq, key, message))
 
-        for i in reversed(range(len(listeners))):
-            try:
-                listeners[i].put_nowait(message)
-            except queue.Full:
-                del listeners[i]
+            listeners = self.qs.get(id, [])
+            for i in reversed(range(len(listeners))):
+                try:
+                    listeners[i].put(message, key)
+                except RuntimeError:
+                    # The listener's event loop has been closed.
+                    del listeners[i]
@@ -0,0 +1,101 @@
+import time
+import argparse
+import itertools
+import numpy
+
+from typing import List
+
+from langchain.embeddings.openai import OpenAIEmbeddings
+
+from Kairos.embeddings import load_embeddings
+
+
+class _StubClient:
+    # Stands in for openai.Embedding: answers after a fixed round-trip time
+    # with random vectors, so the OpenAI path runs offline and unbilled.
+    def __init__(self, latency: float, dim: int):
+        self.latency = latency
+        self.dim = dim
+        self.rng = numpy.random.default_rng(0)
+
+    def create(self, input: List, engine: str):
+        time.sleep(self.latency)
+        return {
+            "data": [
+                {"embedding": self.rng.standard_normal(self.dim).tolist()}
+                for _ in input
+            ]
+        }
+
+
+def _make_texts(count: int, seed: int) -> List[str]:
+    # Chunks of roughly the splitter's size (256 tokens) and varied length.
+    rng = numpy.random.default_rng(seed)
+    words = [f"word{i}" for i in range(5000)]
+    return [
+        " ".join(rng.choice(words, rng.integers(64, 200))) for _ in range(count)
+    ]
+
+
+def _throughput(embeddings, texts: List[str]) -> float:
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report embedding throughput (chunks/s) of each backend."
+    )
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.2,
+        help="round-trip time of the stubbed OpenAI API in seconds",
+    )
+    parser.add_argument(
+        "--backends", nargs="+", default=["sentence-transformers", "onnx"]
+    )
+    parser.add_argument("--model")
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[16, 64, 256])
+    args = parser.parse_args()
+
+    texts = _make_texts(args.chunks, seed=42)
+
+    print(f"chunks: {args.chunks}")
+    print(f"{'backend':<24}{'threads':<9}{'batch':<7}{'chunks/s':>10}")
+
+    # The current path: one request per chunk through langchain's client.
+    openai = OpenAIEmbeddings.construct(
+        client=_StubClient(args.latency, 1536),
+        document_model_name="text-embedding-ada-002",
+        query_model_name="text-embedding-ada-002",
+        embedding_ctx_length=-1,
+    )
+    # A handful of chunks is enough at a fixed latency per request.
+    sample = texts[: max(1, min(len(texts), int(10 / max(args.latency, 0.01))))]
+    print(f"{'openai (stub)':<24}{'-':<9}{'-':<7}{_throughput(openai, sample):>10.1f}")
+
+    for backend, threads, batch_size in itertools.product(
+        args.backends, args.threads, args.batch_sizes
+    ):
+        embeddings = load_embeddings(
+            backend=backend,
+            model=args.model,
+            num_threads=threads,
+            batch_size=batch_size,
+        )
+
+        # Warm-up run, excluded from the timing.
+        embeddings.embed_documents(texts[:batch_size])
+
+        print(
+            f"{backend:<24}{threads:<9}{batch_size:<7}"
+            f"{_throughput(embeddings, texts):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import time
+import argparse
+import faiss
+import numpy
+
+from Kairos.indexes import build_index, tune
+
+
+def _make_vectors(rows: int, dim: int, clusters: int, seed: int) -> numpy.ndarray:
+    # Clustered gaussian data: closer to real embeddings than uniform noise,
+    # which makes every index look equally bad.
+    rng = numpy.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(numpy.float32)
+    labels = rng.integers(0, clusters, rows)
+    noise = 0.3 * rng.standard_normal((rows, dim)).astype(numpy.float32)
+    return centers[labels] + noise
+
+
+def _recall(found: numpy.ndarray, truth: numpy.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def _search(index: faiss.Index, queries: numpy.ndarray, k: int):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = (time.perf_counter() - start) / len(queries)
+    return found, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare recall and latency of each index type against flat."
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--types", nargs="+", default=["ivf-flat", "ivf-pq", "hnsw"])
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--ef-search", nargs="+", type=int, default=[16, 64, 256])
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+
+    # Queries are held-out rows, drawn around the same centers as the data.
+    vectors = _make_vectors(args.rows + args.queries, args.dim, clusters=256, seed=42)
+    vectors, queries = vectors[: args.rows], vectors[args.rows :]
+
+    flat = build_index("flat", vectors, 1, 1)
+    truth, flat_latency = _search(flat, queries, args.k)
+
+    print(f"rows: {args.rows}, dim: {args.dim}, queries: {args.queries}, k: {args.k}")
+    print(f"{'type':<10}{'param':<14}{'build s':>9}{'recall':>9}{'ms/query':>10}")
+    print(f"{'flat':<10}{'-':<14}{'-':>9}{1:>9.3f}{flat_latency * 1000:>10.3f}")
+
+    for type in args.types:
+        start = time.perf_counter()
+        index = build_index(type, vectors, 1, 1)
+        build = time.perf_counter() - start
+
+        if type == "hnsw":
+            params = [("efSearch", value) for value in args.ef_search]
+        else:
+            params = [("nprobe", value) for value in args.nprobe]
+
+        for name, value in params:
+            tune(index, value, value)
+            found, latency = _search(index, queries, args.k)
+            print(
+                f"{type:<10}{f'{name}={value}':<14}{build:>9.1f}"
+                f"{_recall(found, truth):>9.3f}{latency * 1000:>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
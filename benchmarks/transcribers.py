@@ -0,0 +1,77 @@
+import time
+import wave
+import argparse
+import itertools
+import numpy
+
+from Kairos.transcribers import load_transcriber
+
+
+_SAMPLE_RATE = 16000
+
+_CLIP_LENGTH = 30
+
+
+def _load_clip(path: str) -> numpy.ndarray:
+    with wave.open(path, "rb") as file:
+        if file.getframerate() != _SAMPLE_RATE or file.getnchannels() != 1:
+            raise ValueError(f"Clip must be mono {_SAMPLE_RATE} Hz audio")
+        if file.getsampwidth() != 2:
+            raise ValueError("Clip must be 16-bit PCM")
+
+        frames = file.readframes(file.getnframes())
+
+    return numpy.frombuffer(frames, dtype=numpy.int16).astype(numpy.float32) / 32768
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report the real-time factor of each transcriber setting."
+    )
+    # Whisper hallucinates on anything but speech, and its decoding time
+    # depends on the text it produces, so only a real recording is timed.
+    parser.add_argument(
+        "--clip", required=True, help="speech as a mono 16 kHz 16-bit PCM wav file"
+    )
+    parser.add_argument("--backends", nargs="+", default=["transformers"])
+    parser.add_argument("--sizes", nargs="+", default=["tiny", "base", "small"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--quantize", nargs="+", default=["false", "true"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    clip = _load_clip(args.clip)
+    duration = len(clip) / _SAMPLE_RATE
+
+    # Whisper only sees 30 s at a time, so longer clips go in as a batch.
+    step = _SAMPLE_RATE * _CLIP_LENGTH
+    clips = [clip[i : i + step] for i in range(0, len(clip), step)]
+
+    print(f"clip: {duration:.1f}s")
+    print(f"{'backend':<14}{'size':<8}{'threads':<9}{'quantize':<10}{'rtf':>8}")
+
+    for backend, size, threads, quantize in itertools.product(
+        args.backends, args.sizes, args.threads, args.quantize
+    ):
+        transcriber = load_transcriber(
+            backend=backend,
+            size=size,
+            num_threads=threads,
+            quantize=quantize == "true",
+        )
+
+        # Warm-up run, excluded from the timing.
+        transcriber.transcribe(clips)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            transcriber.transcribe(clips)
+        elapsed = (time.perf_counter() - start) / args.repeat
+
+        print(
+            f"{backend:<14}{size:<8}{threads:<9}{quantize:<10}{elapsed / duration:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -215,6 +215,23 @@ export const addSource = async (notebookId: string, type: string, origin: string
     return jobId;
 }
 
+export const addSources = async (notebookId: string, sources: { type: string, origin: string }[]) => {
+    const url = buildUrl(API_URL, {
+        path: `notebooks/${notebookId}/sources/bulk`,
+    });
+
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(sources),
+    });
+    const jobId = await response.json();
+
+    return jobId;
+}
+
 export const getSource = async (notebookId: string, sourceId: string) => {
     const url = buildUrl(API_URL, {
         path: `notebooks/${notebookId}/sources/${sourceId}`,
@@ -254,12 +271,13 @@ export const getSourceSummary = async (notebookId: string, sourceId: string, las
     return jobId;
 }
 
-export const startLiveSource = async (notebookId: string, type: string, origin: string) => {
+export const startLiveSource = async (notebookId: string, type: string, origin: string, streaming?: boolean) => {
     const url = buildUrl(API_URL, {
         path: `notebooks/${notebookId}/live_sources/start`,
         queryParams: {
             type,
-            origin
+            origin,
+            streaming: streaming ? 'true' : undefined
         }
     });
 
@@ -350,21 +368,44 @@ export const getJob = async (notebookId: string, jobId: string) => {
 }
 
 
-const sleep = (time: number) => new Promise(resolve => setTimeout(resolve, time));
+export const cancelJob = async (notebookId: string, jobId: string) => {
+    const url = buildUrl(API_URL, {
+        path: `notebooks/${notebookId}/jobs/${jobId}/cancel`,
+    });
+
+    const response = await fetch(url);
+    const cancelled = await response.json();
+
+    return cancelled;
+}
+
+
+export const waitJob = async (notebookId: string, jobId: string, timeout?: number) => {
+    const url = buildUrl(API_URL, {
+        path: `notebooks/${notebookId}/jobs/${jobId}/wait`,
+        queryParams: {
+            timeout
+        }
+    });
+
+    const response = await fetch(url);
+    const job = await response.json();
+
+    return job;
+}
 
 
 export const joinJob = async <T,>(
     notebookId: string,
     jobId: string,
     onProgressCallback: Function,
-    timeout: number = 250
+    timeout: number = 30
 ): Promise<Job<T>> => {
-    let job = await getJob(notebookId, jobId);
+    let job = await waitJob(notebookId, jobId, timeout);
 
-    while (job.status === 'running') {
+    while (job.status === 'queued' || job.status === 'running') {
         onProgressCallback(job);
-        await sleep(timeout);
-        job = await getJob(notebookId, jobId);
+        job = await waitJob(notebookId, jobId, timeout);
     }
 
     return job;
@@ -1,7 +1,7 @@
 import React, { createContext, useMemo, useRef } from 'react'
 import { useCallback, useEffect, useState } from 'react';
 import { useParams } from 'react-router-dom';
-import { addSource as _addSource, getIdeas, getSourceSummary, joinJob, notebookEdit, notebookGenerate, notebookRun, saveNotebook, startLiveSource as _startLiveSource, stopLiveSource as _stopLiveSource, renameNotebook, notebookChat, getEvents, getName, getSources, getLiveSources, getConversation, getGenerations, getContent, getRunningLiveSources, getJobs, getPCA } from '../api';
+import { addSource as _addSource, getIdeas, getSourceSummary, getLiveSourceSummary, joinJob, notebookEdit, notebookGenerate, notebookRun, saveNotebook, startLiveSource as _startLiveSource, stopLiveSource as _stopLiveSource, renameNotebook, notebookChat, getEvents, getName, getSources, getLiveSources, getConversation, getGenerations, getContent, getRunningLiveSources, getJobs, getPCA } from '../api';
 import { Generation, INotebookContext, Job, Message, Source, XYT } from '../typings';
 import { Tiptap } from '../components/Tiptap';
 import { useEditor } from '@tiptap/react';
@@ -238,7 +238,7 @@ export const Notebook = () => {
   }, [id, fetchGenerations, api, insert])
 
   const liveSourceSummary = useCallback(async (sourceId: string) => {
-    const { error, output } = await joinJob<string>(id!, await getSourceSummary(id!, sourceId), () => { });
+    const { error, output } = await joinJob<string>(id!, await getLiveSourceSummary(id!, sourceId), () => { });
 
     if (error) return api.error({
       message: "Oh no! Something went wrong.",
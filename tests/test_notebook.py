@@ -0,0 +1,46 @@
+import os
+import asyncio
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["LLM_CACHE"] = ""
+
+from Kairos import notebook
+from Kairos.notebook import Notebook
+from Kairos.llm import PooledOpenAI
+
+
+class _FakeClient:
+    # Answers each streamed completion with the next scripted text.
+    def __init__(self, completions):
+        self.completions = list(completions)
+
+    async def acreate(self, **kwargs):
+        text = self.completions.pop(0)
+
+        async def _stream():
+            yield {
+                "choices": [{"text": text, "finish_reason": "stop", "logprobs": None}]
+            }
+
+        return _stream()
+
+
+def test_arun_uses_tool_coroutines(monkeypatch):
+    monkeypatch.setattr(
+        notebook._llm,
+        "client",
+        _FakeClient(
+            [
+                " I should add the numbers.\nAction: Calculator\nAction Input: 1 + 1",
+                " I now know the final answer.\nFinal Answer: 2",
+            ]
+        ),
+    )
+    # max_tokens=-1 counts the prompt's tokens, which downloads an encoding.
+    monkeypatch.setattr(PooledOpenAI, "max_tokens_for_prompt", lambda self, _: 256)
+    monkeypatch.setattr(notebook, "_calculate", lambda query: "Answer: 2")
+
+    nb = Notebook()
+
+    assert asyncio.run(nb.arun("What is 1 + 1?")) == "2"
+    assert nb.generations[-1].output == "2"